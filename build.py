@@ -1,6 +1,8 @@
 from core.down_llms import download_all_files,is_socket_connected,check_proxy_running
 from core.build_table_of_contents import build_table_of_contents
 from core.build_markdown import build_markdown
+from core.utils.class_registry import build_class_registries
+from core.tushare_doc.ts_code_matcher import build_ts_code_index
 
 if __name__ =="__main__":
     proxy_host = "127.0.0.1"
@@ -9,4 +11,6 @@ if __name__ =="__main__":
         check_proxy_running(proxy_host, proxy_port, "http")
     download_all_files()
     build_table_of_contents()
-    build_markdown()
\ No newline at end of file
+    build_markdown()
+    build_class_registries()
+    build_ts_code_index()
\ No newline at end of file
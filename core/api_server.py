@@ -0,0 +1,107 @@
+"""
+library 计划的 HTTP 服务
+
+    GET  /agenda                 议程列表
+    POST /jobs                   提交任务 {"index": 2, "params": {"symbol": "600000"}}，返回任务id
+    GET  /jobs                   任务列表
+    GET  /jobs/{job_id}          任务状态和最终报告，?events=true 时返回所有事件
+    GET  /jobs/{job_id}/stream   按 server-sent events 输出步骤的运行过程，任务结束后关闭
+                                 断线重连时可以用 ?start=N 或 Last-Event-ID 从第 N 个事件继续
+
+任务在 JobManager 的线程池中运行，多个用户可以同时运行计划，不占用 Streamlit 的脚本线程。
+
+setting.ini 中可以配置:
+    api_host = 127.0.0.1
+    api_port = 8000
+    api_workers = 4          # 同时运行的计划数量，大于 1 时步骤总是在 process 执行器的工作进程中运行
+"""
+import json
+from typing import Dict, Optional
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from core.job_manager import JobManager
+from core.utils.config_setting import Config
+
+
+class JobRequest(BaseModel):
+    index: int
+    params: Dict[str, str] = {}
+
+
+def _get_config(key: str, default: str) -> str:
+    config = Config()
+    return config.get(key) if config.has_key(key) else default
+
+
+def load_agenda():
+    with open('./json/agenda.json', 'r', encoding='utf-8') as agenda_file:
+        return json.load(agenda_file)
+
+
+def create_app(job_manager: Optional[JobManager] = None) -> FastAPI:
+    app = FastAPI(title="akshare code library")
+    manager = job_manager or JobManager(max_workers=int(_get_config("api_workers", "4")))
+
+    @app.on_event("shutdown")
+    def shutdown():
+        manager.shutdown()
+
+    @app.get("/agenda")
+    def get_agenda():
+        return load_agenda()
+
+    @app.post("/jobs")
+    def submit_job(request: JobRequest):
+        item = next((entry for entry in load_agenda() if entry["index"] == request.index), None)
+        if not item:
+            raise HTTPException(status_code=404, detail=f"No entry with index {request.index}")
+        # 没有提供的参数使用 plan.json 中的默认值
+        job = manager.submit(request.index, request.params)
+        return job.to_dict()
+
+    @app.get("/jobs")
+    def list_jobs():
+        return [job.to_dict() for job in manager.jobs()]
+
+    @app.get("/jobs/{job_id}")
+    def get_job(job_id: str, events: bool = False):
+        job = manager.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        return job.to_dict(with_events=events)
+
+    @app.get("/jobs/{job_id}/stream")
+    def stream_job(job_id: str, start: int = 0, last_event_id: Optional[str] = Header(None)):
+        job = manager.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        if last_event_id is not None and last_event_id.isdigit():
+            start = int(last_event_id) + 1
+
+        def event_stream():
+            # 普通的生成器由 FastAPI 在线程池中迭代，等待新事件时不会阻塞事件循环
+            position = start
+            for event in job.iter_events(start):
+                if event is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                data = json.dumps(event, ensure_ascii=False, default=str)
+                yield f"id: {position}\nevent: {event['type']}\ndata: {data}\n\n"
+                position += 1
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    return app
+
+
+def main():
+    import uvicorn
+    from core.interpreter.step_data_store import configure_copy_on_write
+    configure_copy_on_write()
+    uvicorn.run(create_app(), host=_get_config("api_host", "127.0.0.1"), port=int(_get_config("api_port", "8000")))
+
+
+if __name__ == "__main__":
+    main()
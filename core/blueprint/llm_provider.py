@@ -21,22 +21,29 @@ class LLMProvider:
         if self._initialized:
             return
         self._llm_factory = LLMFactory()
-        self._cheap_factory = LLMCheapFactory()
-        self._embedding_factory = EmbeddingFactory()
+        # 便宜模型和 embedding 的工厂在第一次使用时才创建
+        self._cheap_factory = None
+        self._embedding_factory = None
         self._data_summarizer = DataSummarizer()
         self._llm_client = None
         self._cheap_client = None
         self._embedding_client = None
         self._initialized = True
+        from ..utils.config_setting import Config
+        config = Config()
+        if config.has_key("embedding_preload") and config.get("embedding_preload").lower() == "true":
+            self.embedding_factory.preload()
     
     @property
     def embedding_factory(self):
+        if self._embedding_factory is None:
+            self._embedding_factory = EmbeddingFactory()
         return self._embedding_factory
 
     @property
     def embedding_client(self):
         if self._embedding_client is None:
-            self._embedding_client = self._embedding_factory.get_instance()
+            self._embedding_client = self.embedding_factory.get_instance()
         return self._embedding_client
 
     @property
@@ -45,6 +52,8 @@ class LLMProvider:
     
     @property
     def cheap_factory(self):
+        if self._cheap_factory is None:
+            self._cheap_factory = LLMCheapFactory()
         return self._cheap_factory
     
     @property
@@ -56,17 +65,17 @@ class LLMProvider:
     @property
     def cheap_client(self):
         if self._cheap_client is None:
-            self._cheap_client = self._cheap_factory.get_instance()
+            self._cheap_client = self.cheap_factory.get_instance()
         return self._cheap_client
     
     def new_llm_client(self)->LLMApiClient:
         return self._llm_factory.get_instance()
     
     def new_cheap_client(self)->LLMApiClient:
-        return self._cheap_factory.get_instance()
+        return self.cheap_factory.get_instance()
     
     def new_embedding_client(self)->Embedding:
-        return self._embedding_factory.get_instance()
+        return self.embedding_factory.get_instance()
     
     def new_code_runner(self):
         return ASTCodeRunner()
\ No newline at end of file
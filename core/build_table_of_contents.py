@@ -19,6 +19,12 @@ def build_table_of_contents():
     output_file = "./json/agenda.json"
     agenda = []
 
+    # 保留已有目录中手工配置的 schedule
+    schedules = {}
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8') as agenda_file:
+            schedules = {item["path"]: item["schedule"] for item in json.load(agenda_file) if "schedule" in item}
+
     for dir_name in os.listdir(library_dir):
         dir_path = os.path.join(library_dir, dir_name)
         if os.path.isdir(dir_path):
@@ -47,6 +53,8 @@ def build_table_of_contents():
                     "path": relative_path,
                     "params": ",".join(sorted(all_params)) if all_params else ""
                 }
+                if relative_path in schedules:
+                    agenda_item["schedule"] = schedules[relative_path]
                 agenda.append(agenda_item)
     
     # Sort by create_time
@@ -39,7 +39,6 @@ files_to_download = [
     "core/tushare_doc/__init__.py",
     "core/tushare_doc/ts_code_matcher.py",
     "json/tushare_code_20240804.pickle",
-    "json/tushare_code_20240804_index_content_ts_code.pickle",
 ]
 
 def get_github_token():
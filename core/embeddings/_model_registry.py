@@ -0,0 +1,134 @@
+"""
+进程级的本地模型注册表
+
+本地 embedding/ranker 的模型只在第一次使用时加载一次，之后所有实例、所有线程共享同一份权重。
+setting.ini 中可以配置:
+    embedding_max_models = 2        # 最多同时保留的模型数量，超出后卸载最久未使用的模型
+    embedding_max_memory_mb = 4096  # 模型权重占用的内存上限(MB)，超出后卸载最久未使用的模型
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple, Union
+from ..utils.single_ton import Singleton
+from ..utils.config_setting import Config
+
+
+def _estimate_size(model: Any) -> int:
+    # 只统计 torch 模型的参数大小，onnxruntime 等其他后端无法估算时返回 0
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+    except Exception:
+        return 0
+
+
+class ModelRegistry(metaclass=Singleton):
+    def __init__(self):
+        self._models: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._load_times: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        config = Config()
+        self.max_models = int(config.get("embedding_max_models")) if config.has_key("embedding_max_models") else 0
+        self.max_memory = int(config.get("embedding_max_memory_mb")) * 1024 * 1024 if config.has_key("embedding_max_memory_mb") else 0
+
+    def _get_key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        获取模型，不存在时调用 loader 加载
+        同一个 key 在多个线程同时请求时只会加载一次，不同 key 可以并行加载
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+        with self._get_key_lock(key):
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+
+            start_time = time.time()
+            model = loader()
+            elapsed = time.time() - start_time
+
+            with self._lock:
+                self._models[key] = model
+                self._sizes[key] = _estimate_size(model)
+                self._load_times[key] = elapsed
+                self._evict()
+            print(f"模型 {key} 加载完成，耗时 {elapsed:.2f} 秒")
+            return model
+
+    def _evict(self):
+        # 调用方需要持有 self._lock，最新加载的模型不会被卸载
+        while len(self._models) > 1:
+            over_count = self.max_models and len(self._models) > self.max_models
+            over_memory = self.max_memory and sum(self._sizes.values()) > self.max_memory
+            if not (over_count or over_memory):
+                break
+            key, _ = self._models.popitem(last=False)
+            self._sizes.pop(key, None)
+            self._load_times.pop(key, None)
+            print(f"模型 {key} 超出限制，已卸载")
+
+    def is_loaded(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._models
+
+    def unload(self, key: Hashable = None):
+        """卸载指定模型，key 为 None 时卸载全部模型"""
+        with self._lock:
+            if key is None:
+                self._models.clear()
+                self._sizes.clear()
+                self._load_times.clear()
+            else:
+                self._models.pop(key, None)
+                self._sizes.pop(key, None)
+                self._load_times.pop(key, None)
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"key": key, "size_mb": self._sizes.get(key, 0) / 1024 / 1024, "load_time": self._load_times.get(key, 0)}
+                for key in self._models
+            ]
+
+    def preload(self, items: Iterable[Union[Tuple[Hashable, Callable[[], Any]], Callable[[], Any]]], background: bool = True):
+        """
+        预加载模型，background 为 True 时在后台线程中加载并返回线程对象
+        items 中的元素为 (key, loader)，或者是内部通过注册表加载模型的函数(比如读取实例的 model 属性)
+        """
+        items = list(items)
+
+        def load_all():
+            for item in items:
+                key, loader = item if isinstance(item, tuple) else (getattr(item, "__name__", item), item)
+                try:
+                    if isinstance(item, tuple):
+                        self.get(key, loader)
+                    else:
+                        loader()
+                except Exception as e:
+                    print(f"预加载模型 {key} 失败: {e}")
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-preload", daemon=True)
+        thread.start()
+        return thread
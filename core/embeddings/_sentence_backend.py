@@ -0,0 +1,178 @@
+"""
+本地 sentence_transformers 模型的加载后端
+
+默认后端是 torch(fp32)，在只有CPU的服务器上可以切换为:
+    onnx       导出为 ONNX，用 onnxruntime 推理
+    onnx_int8  ONNX + int8 动态量化
+    torch_int8 torch 动态量化(只量化 Linear 层)
+
+在 setting.ini 中配置:
+    embedding_backend = onnx_int8          # 所有本地embedding的默认后端
+    BGEM3Embedding_backend = torch         # 单个类的后端，优先级更高
+
+onnx 相关后端需要 sentence-transformers>=3.2 以及 pip install optimum[onnxruntime]
+"""
+import os
+import time
+from typing import Dict, List
+
+BACKENDS = ("torch", "onnx", "onnx_int8", "torch_int8")
+ONNX_CACHE_DIR = "./models/onnx"
+
+
+def get_backend(class_name: str = "") -> str:
+    from ..utils.config_setting import Config
+    config = Config()
+    backend = "torch"
+    if config.has_key("embedding_backend"):
+        backend = config.get("embedding_backend")
+    if class_name and config.has_key(f"{class_name}_backend"):
+        backend = config.get(f"{class_name}_backend")
+    backend = backend.strip().lower() or "torch"
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的 embedding 后端: {backend}，可选值: {', '.join(BACKENDS)}")
+    return backend
+
+
+def _get_hugging_face_token() -> str:
+    from ..utils.config_setting import Config
+    api_key = ""
+    config = Config()
+    if config.has_key("hugging_face_api_key"):
+        api_key = config.get("hugging_face_api_key")
+    # 设置 API Key
+    if api_key:
+        os.environ['HUGGING_FACE_HUB_TOKEN'] = api_key
+    return api_key
+
+
+def _onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "--"))
+
+
+def _quantization_config() -> str:
+    # 按CPU指令集选择量化配置，avx512_vnni 最快，arm64 用于苹果和ARM服务器
+    import platform
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = f.read()
+        if "avx512_vnni" in flags:
+            return "avx512_vnni"
+        if "avx512" in flags:
+            return "avx512"
+    except OSError:
+        pass
+    return "avx2"
+
+
+def _load_onnx(model_name: str, token: str, quantize: bool):
+    from sentence_transformers import SentenceTransformer
+    model_dir = _onnx_model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, "onnx", "model.onnx")):
+        # 第一次使用时从 huggingface 模型导出 ONNX，之后直接读取本地文件
+        print(f"正在把 {model_name} 导出为 ONNX: {model_dir}")
+        model = SentenceTransformer(model_name, device="cpu", token=token, backend="onnx")
+        model.save_pretrained(model_dir)
+    if not quantize:
+        return SentenceTransformer(model_dir, device="cpu", backend="onnx")
+
+    config_name = _quantization_config()
+    file_name = f"model_qint8_{config_name}.onnx"
+    if not os.path.exists(os.path.join(model_dir, "onnx", file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        print(f"正在量化 {model_name}: {config_name}")
+        model = SentenceTransformer(model_dir, device="cpu", backend="onnx")
+        export_dynamic_quantized_onnx_model(model, config_name, model_dir)
+    return SentenceTransformer(model_dir, device="cpu", backend="onnx",
+                               model_kwargs={"file_name": f"onnx/{file_name}"})
+
+
+def load_sentence_transformer(model_name: str, class_name: str = "", backend: str = ""):
+    """
+    按配置的后端加载 SentenceTransformer 模型
+    同一个模型和后端在进程内只加载一次，由 ModelRegistry 共享
+    :param model_name: huggingface 模型名
+    :param class_name: embedding 类名，用于读取 {class_name}_backend 配置
+    :param backend: 直接指定后端，不读取配置
+    """
+    from ._model_registry import ModelRegistry
+    backend = backend or get_backend(class_name)
+    return ModelRegistry().get(("sentence_transformer", model_name, backend),
+                               lambda: _load_sentence_transformer(model_name, backend))
+
+
+def _load_sentence_transformer(model_name: str, backend: str):
+    token = _get_hugging_face_token()
+    if backend == "onnx":
+        return _load_onnx(model_name, token, quantize=False)
+    if backend == "onnx_int8":
+        return _load_onnx(model_name, token, quantize=True)
+
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch_int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu", token=token)
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    from ..utils.get_sentence_device import get_sentence_transformer_device
+    device = get_sentence_transformer_device()
+    return SentenceTransformer(model_name, device=device, token=token)
+
+
+def load_cross_encoder(model_name: str, max_length: int = 1024, **kwargs):
+    """
+    加载 CrossEncoder 排序模型，同一个模型和 max_length 在进程内只加载一次
+    """
+    from ._model_registry import ModelRegistry
+
+    def loader():
+        from sentence_transformers import CrossEncoder
+        from ..utils.get_sentence_device import get_sentence_transformer_device
+        _get_hugging_face_token()
+        device = get_sentence_transformer_device()
+        return CrossEncoder(model_name, device=device, max_length=max_length, **kwargs)
+
+    return ModelRegistry().get(("cross_encoder", model_name, max_length), loader)
+
+
+def check_parity(model_name: str, sentences: List[str], backend: str, min_cosine: float = 0.99) -> Dict[str, float]:
+    """
+    对比指定后端与 fp32 torch 后端的向量，检查精度是否一致
+    返回最小/平均余弦相似度，最小值低于 min_cosine 时抛出 AssertionError
+    """
+    import numpy as np
+    reference = load_sentence_transformer(model_name, backend="torch").encode(sentences, normalize_embeddings=True)
+    candidate = load_sentence_transformer(model_name, backend=backend).encode(sentences, normalize_embeddings=True)
+    cosine = np.sum(np.asarray(reference) * np.asarray(candidate), axis=1)
+    result = {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+    if result["min_cosine"] < min_cosine:
+        raise AssertionError(f"{model_name} 的 {backend} 后端精度不足: {result}")
+    return result
+
+
+def benchmark(model_name: str, sentences: List[str], backends=BACKENDS, batch_size: int = 32, repeat: int = 3) -> Dict[str, float]:
+    """
+    测试各个后端的吞吐量，返回 {后端: 每秒句子数}
+    """
+    result = {}
+    for backend in backends:
+        model = load_sentence_transformer(model_name, backend=backend)
+        model.encode(sentences[:batch_size], batch_size=batch_size)  # 预热
+        start_time = time.time()
+        for _ in range(repeat):
+            model.encode(sentences, batch_size=batch_size)
+        elapsed = time.time() - start_time
+        result[backend] = len(sentences) * repeat / elapsed
+        print(f"{model_name} [{backend}]: {result[backend]:.1f} 句/秒")
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+    name = sys.argv[1] if len(sys.argv) > 1 else "BAAI/bge-base-zh-v1.5"
+    samples = [f"第{i}条测试新闻：央行开展逆回购操作，市场流动性保持合理充裕。" for i in range(256)]
+    for b in BACKENDS[1:]:
+        print(b, check_parity(name, samples[:32], b, min_cosine=0.95))
+    benchmark(name, samples)
@@ -1,21 +1,16 @@
-from sentence_transformers import CrossEncoder
 from typing import List
 from ._ranker import Ranker
 
 class BCEBaseRanker(Ranker):
     def __init__(self,max_length:int=1024):
-        from ..utils.get_sentence_device import get_sentence_transformer_device
-        device = get_sentence_transformer_device()
-        from ..utils.config_setting import Config
-        api_key = ""
-        config = Config()
-        if config.has_key("hugging_face_api_key"):
-            api_key = config.get("hugging_face_api_key")
-        # 设置 API Key
-        if api_key:
-            import os
-            os.environ['HUGGING_FACE_HUB_TOKEN'] = api_key
-        self.model = CrossEncoder('maidalun1020/bce-reranker-base_v1',device=device,max_length=max_length)
+        # 模型在第一次使用时才加载，多个实例共享同一份权重
+        self.model_name = 'maidalun1020/bce-reranker-base_v1'
+        self.max_length = max_length
+
+    @property
+    def model(self):
+        from ._sentence_backend import load_cross_encoder
+        return load_cross_encoder(self.model_name, self.max_length)
 
     def get_scores(self, pairs:List[List[str]]) -> List[List[float]]:
         return self.model.predict(pairs) 
\ No newline at end of file
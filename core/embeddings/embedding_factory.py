@@ -1,28 +1,26 @@
 import os
-import re
 import importlib
 from typing import Dict, Type
 from ..utils.single_ton import Singleton
 from ..utils.config_setting import Config
+from ..utils.class_registry import discover_classes
 from ._embedding import Embedding
 
 class EmbeddingFactory(metaclass=Singleton):
+    # 实现类的类名，匹配结果按文件修改时间缓存在 __pycache__/class_registry.json 中
+    CLASS_PATTERN = r'class\s+(\w+)\s*\([^)]*Embedding[^)]*\):'
+
     def __init__(self):
         self.embedding_classes: Dict[str, str] = {}  # 存储类名和文件名的映射
         self._discover_embedding_classes()
 
-    def _discover_embedding_classes(self):
+    @classmethod
+    def discover(cls, rebuild: bool = False) -> Dict[str, str]:
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        embedding_pattern = re.compile(r'class\s+(\w+)\s*\([^)]*Embedding[^)]*\):')
-        
-        for filename in os.listdir(current_dir):
-            if filename.endswith('.py') and not filename.startswith('_'):
-                file_path = os.path.join(current_dir, filename)
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    matches = embedding_pattern.findall(content)
-                    for class_name in matches:
-                        self.embedding_classes[class_name] = filename[:-3]  # 存储类名和模块名的映射
+        return discover_classes(current_dir, cls.CLASS_PATTERN, rebuild)  # 存储类名和模块名的映射
+
+    def _discover_embedding_classes(self):
+        self.embedding_classes.update(self.discover())
 
     def get_instance(self, name: str = "") -> Embedding:
         config = Config()
@@ -42,5 +40,20 @@ class EmbeddingFactory(metaclass=Singleton):
         except AttributeError:
             raise ValueError(f"Class {name} not found in module {module_name}")
 
+    def preload(self, name: str = "", background: bool = True):
+        """
+        提前加载本地模型，background 为 True 时在后台线程中加载，不阻塞启动
+        基于API的Embedding没有本地模型，直接跳过
+        """
+        from ._model_registry import ModelRegistry
+
+        def preload_embedding():
+            instance = self.get_instance(name)
+            # 本地模型的 model 属性通过 ModelRegistry 加载并共享
+            if hasattr(type(instance), "model"):
+                instance.model
+
+        return ModelRegistry().preload([preload_embedding], background)
+
     def list_available_embeddings(self) -> list[str]:
         return list(self.embedding_classes.keys())
\ No newline at end of file
@@ -1,21 +1,15 @@
-from sentence_transformers import SentenceTransformer
 from typing import List
 from ._embedding import Embedding
 
 class VectorChineseEmbedding(Embedding):
     def __init__(self):
-        from ..utils.get_sentence_device import get_sentence_transformer_device
-        device = get_sentence_transformer_device()
-        from ..utils.config_setting import Config
-        api_key = ""
-        config = Config()
-        if config.has_key("hugging_face_api_key"):
-            api_key = config.get("hugging_face_api_key")
-        # 设置 API Key
-        if api_key:
-            import os
-            os.environ['HUGGING_FACE_HUB_TOKEN'] = api_key
-        self.model = SentenceTransformer('shibing624/text2vec-base-chinese',device=device,token=api_key)
+        # 模型在第一次使用时才加载，多个实例共享同一份权重
+        self.model_name = 'shibing624/text2vec-base-chinese'
+
+    @property
+    def model(self):
+        from ._sentence_backend import load_sentence_transformer
+        return load_sentence_transformer(self.model_name, type(self).__name__)
 
     def convert_to_embedding(self, input_strings: List[str]) -> List[List[float]]:
         return self.model.encode(input_strings).tolist()
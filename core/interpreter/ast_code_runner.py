@@ -1,31 +1,92 @@
 import ast
+import hashlib
+import marshal
 import sys
 import io
 import os
-from typing import Any, Dict, Generator, Tuple
+import threading
+from contextvars import ContextVar
+from functools import lru_cache
+from types import CodeType
+from typing import Any, Dict, Generator, Optional, Tuple, Union
+from .code_cache import CompiledCodeCache
+
+# 当前执行上下文的标准输出和错误输出缓冲区，为 None 时写到原来的 sys.stdout/sys.stderr
+_current_output: ContextVar[Optional[io.StringIO]] = ContextVar("ast_code_runner_output", default=None)
+_current_error: ContextVar[Optional[io.StringIO]] = ContextVar("ast_code_runner_error", default=None)
+_install_lock = threading.Lock()
+
+
+class _ContextStream:
+    """
+    替换 sys.stdout/sys.stderr 的代理，按 contextvars 把输出写到当前执行的缓冲区
+    每个线程(以及 asyncio 任务)有自己的上下文，多个 run 可以同时执行而不会互相串行输出
+    """
+
+    def __init__(self, original, current: ContextVar):
+        self._original = original
+        self._current = current
+
+    def _target(self):
+        output = self._current.get()
+        return self._original if output is None else output
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def writelines(self, lines):
+        return self._target().writelines(lines)
+
+    def flush(self):
+        return self._target().flush()
+
+    def isatty(self):
+        return self._current.get() is None and self._original.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+@lru_cache(maxsize=None)
+def _code_fingerprint(code: CodeType) -> str:
+    return hashlib.sha256(marshal.dumps(code)).hexdigest()[:16]
+
+
+def install_output_proxy():
+    """把 sys.stdout/sys.stderr 替换为代理，只需要执行一次"""
+    with _install_lock:
+        if sys.stdout is not None and not isinstance(sys.stdout, _ContextStream):
+            sys.stdout = _ContextStream(sys.stdout, _current_output)
+        if sys.stderr is not None and not isinstance(sys.stderr, _ContextStream):
+            sys.stderr = _ContextStream(sys.stderr, _current_error)
+
 
 class ASTCodeRunner:
+    # 修改安全检查规则时增加版本号，缓存中旧的检查结果会失效
+    SECURITY_RULES_VERSION = 1
+
     def __init__(self, debug=False):
         self.debug = debug
+        install_output_proxy()
 
     def run_sse(self, code: str, global_vars: Dict[str, Any]) -> Generator[Dict[str, Any], None, None]:
-        old_stdout = sys.stdout
         redirected_output = io.StringIO()
-        sys.stdout = redirected_output
 
         try:
             if self.debug:
                 yield {"type": "debug", "content": f"调试信息: 准备执行下面的代码:\n{code}"}
 
-            tree = ast.parse(code)
-            self.check_security(tree)  # 添加安全检查
+            # 解析、安全检查和编译的结果按源码哈希缓存
+            compiled, security_error = CompiledCodeCache().compile(code, '<string>', self.scan_security, self.security_version)
+            if security_error:
+                raise SecurityException(security_error)
 
             exec_globals = global_vars.copy()
-            exec_globals['print'] = lambda *args, **kwargs: print(*args, **kwargs, file=redirected_output, flush=True)
             exec_globals['open'] = self.safe_open  # 使用安全的 open 函数
 
             # 使用 exec 执行整个代码块，而不是逐节点执行
-            exec(compile(tree, '<string>', 'exec'), exec_globals)
+            # 只在 exec 期间切换输出上下文，yield 之后调用方的输出不会被捕获
+            self._exec(compiled, exec_globals, redirected_output)
 
             # 捕获输出
             output = redirected_output.getvalue()
@@ -39,13 +100,11 @@ class ASTCodeRunner:
         except Exception as e:
             yield {"type": "error", "content": str(e)}
             raise e
-        finally:
-            sys.stdout = old_stdout
 
-    def run(self, code: str, global_vars: Dict[str, Any]={}) -> Dict[str, Any]:
+    def run(self, code: Union[str, CodeType], global_vars: Dict[str, Any]={}) -> Dict[str, Any]:
         """
         input:
-            code: 代码字符串
+            code: 代码字符串或编译好的代码对象
             global_vars: 全局变量字典
         output:
             result: 执行结果字典
@@ -54,13 +113,10 @@ class ASTCodeRunner:
                 updated_vars: 更新后的全局变量
                 debug: 调试信息
         """
-        # 准备捕获输出
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
+        # 准备捕获输出，sys.stdout/sys.stderr 按上下文写到各自的缓冲区，多个线程可以同时执行
+        # 错误输出(库的警告、进度条等)不放进 output，只在出错时附加到 error 后面
         redirected_output = io.StringIO()
         redirected_error = io.StringIO()
-        sys.stdout = redirected_output
-        sys.stderr = redirected_error
 
         result = {
             "output": "",
@@ -71,13 +127,14 @@ class ASTCodeRunner:
 
         try:
             if self.debug:
-                result["debug"] = f"调试信息: 准备执行下面的代码:\n{code}"
+                source = code if isinstance(code, str) else code.co_filename
+                result["debug"] = f"调试信息: 准备执行下面的代码:\n{source}"
 
             # 准备执行环境
             exec_globals = global_vars.copy()
             
             # 执行代码
-            exec(code, exec_globals)
+            self._exec(code, exec_globals, redirected_output, redirected_error)
 
             # 捕获输出
             result["output"] = redirected_output.getvalue()
@@ -86,15 +143,36 @@ class ASTCodeRunner:
             result["updated_vars"] = {k: v for k, v in exec_globals.items() if k not in global_vars or global_vars[k] is not v}
 
         except Exception as e:
+            result["output"] = redirected_output.getvalue()
             result["error"] = f"{type(e).__name__}: {str(e)}"
             result["error"] += f"\n{redirected_error.getvalue()}"
-        finally:
-            # 恢复标准输出和错误流
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
 
         return result
 
+    def run_file(self, path: str, global_vars: Dict[str, Any]={}) -> Dict[str, Any]:
+        """
+        执行步骤文件，输出和 run 相同
+        编译结果和安全检查结果缓存在步骤文件旁边的 __pycache__ 中，文件没有修改时不再解析和编译
+        """
+        try:
+            _, compiled, security_error = CompiledCodeCache().load_file(path, self.scan_security, self.security_version)
+        except (OSError, SyntaxError, ValueError) as e:
+            return {"output": "", "error": f"{type(e).__name__}: {str(e)}", "updated_vars": {}, "debug": None}
+        if security_error:
+            return {"output": "", "error": f"SecurityException: {security_error}", "updated_vars": {}, "debug": None}
+        return self.run(compiled, global_vars)
+
+    @staticmethod
+    def _exec(code, exec_globals, output, error=None):
+        """error 为 None 时错误输出写到原来的 sys.stderr"""
+        token = _current_output.set(output)
+        error_token = _current_error.set(error)
+        try:
+            exec(code, exec_globals)
+        finally:
+            _current_error.reset(error_token)
+            _current_output.reset(token)
+
     def execute_node(self, node, exec_globals):
         if isinstance(node, ast.Expr):
             # 表达式语句
@@ -113,6 +191,19 @@ class ASTCodeRunner:
             # 其他类型的语句
             exec(compile(ast.Module([node], type_ignores=[]), '<string>', 'exec'), exec_globals)
 
+    @property
+    def security_version(self) -> str:
+        """安全检查规则的版本: 版本号加上 check_security 字节码的哈希，忘记增加版本号时规则修改也会使缓存失效"""
+        return f"{self.SECURITY_RULES_VERSION}.{_code_fingerprint(type(self).check_security.__code__)}"
+
+    def scan_security(self, tree) -> Optional[str]:
+        """安全检查，返回错误信息，没有问题时返回 None"""
+        try:
+            self.check_security(tree)
+        except SecurityException as e:
+            return str(e)
+        return None
+
     def check_security(self, tree):
         for node in ast.walk(tree):
             # 检查是否有删除文件的操作
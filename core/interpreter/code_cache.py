@@ -0,0 +1,135 @@
+"""
+步骤代码的编译缓存
+
+library 中的 step_code_N.py 每次运行都要解析、做安全检查、编译，定时任务每隔几分钟运行一次计划时这部分开销会不断重复。
+CompiledCodeCache 按源码的 sha256 缓存编译好的代码对象和安全检查结果:
+    内存: 同一个进程内重复运行直接使用
+    磁盘: 和 Python 的 __pycache__ 一样保存在步骤文件旁边，
+         library/<id>/__pycache__/step_code_1.cpython-311.<hash>.step
+源码修改后哈希变化，旧的缓存文件会被替换。
+缓存文件中还记录了安全检查规则的版本(scan_version)，规则修改后旧的检查结果不再使用。
+"""
+import ast
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+import threading
+from collections import OrderedDict
+from types import CodeType
+from typing import Callable, Optional, Tuple
+from ..utils.single_ton import Singleton
+
+CACHE_SUFFIX = ".step"
+
+# 安全检查函数，返回错误信息，没有问题时返回 None
+SecurityScan = Callable[[ast.AST], Optional[str]]
+
+
+class CompiledCodeCache(metaclass=Singleton):
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[Optional[CodeType], Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def source_hash(source: str) -> str:
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cache_path(path: str, digest: str) -> str:
+        directory, file_name = os.path.split(os.path.abspath(path))
+        stem = os.path.splitext(file_name)[0]
+        return os.path.join(directory, "__pycache__", f"{stem}.{sys.implementation.cache_tag}.{digest[:16]}{CACHE_SUFFIX}")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def _compile(source: str, filename: str, scan: Optional[SecurityScan]):
+        tree = ast.parse(source, filename)
+        error = scan(tree) if scan else None
+        if error:
+            return None, error
+        return compile(tree, filename, "exec"), None
+
+    def compile(self, source: str, filename: str = "<string>", scan: Optional[SecurityScan] = None,
+                scan_version: str = "") -> Tuple[Optional[CodeType], Optional[str]]:
+        """
+        编译源码，只使用内存缓存
+        返回 (代码对象, 安全检查错误信息)，安全检查不通过时代码对象为 None
+        """
+        key = (filename, self.source_hash(source), scan_version)
+        entry = self._lookup(key)
+        if entry is None:
+            entry = self._compile(source, filename, scan)
+            self._remember(key, entry)
+        return entry
+
+    def load_file(self, path: str, scan: Optional[SecurityScan] = None,
+                  scan_version: str = "") -> Tuple[str, Optional[CodeType], Optional[str]]:
+        """
+        读取并编译步骤文件，优先使用内存缓存和 __pycache__ 中的缓存
+        scan_version 是安全检查规则的版本，和缓存中记录的不一致时重新检查
+        返回 (源码, 代码对象, 安全检查错误信息)
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        filename = os.path.abspath(path)
+        digest = self.source_hash(source)
+        key = (filename, digest, scan_version)
+        entry = self._lookup(key)
+        if entry is not None:
+            return (source,) + entry
+
+        cache_path = self._cache_path(path, digest)
+        entry = self._read_cache(cache_path, digest, scan_version)
+        if entry is None:
+            entry = self._compile(source, filename, scan)
+            self._write_cache(cache_path, digest, scan_version, entry)
+        self._remember(key, entry)
+        return (source,) + entry
+
+    @staticmethod
+    def _read_cache(cache_path: str, digest: str, scan_version: str):
+        try:
+            with open(cache_path, "rb") as f:
+                magic, cached_digest, cached_version, code, error = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if magic != importlib.util.MAGIC_NUMBER or cached_digest != digest or cached_version != scan_version:
+            return None
+        return code, error
+
+    @staticmethod
+    def _write_cache(cache_path: str, digest: str, scan_version: str, entry):
+        directory = os.path.dirname(cache_path)
+        prefix = os.path.basename(cache_path).rsplit(".", 2)[0] + "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # 删除同一个步骤文件旧版本的缓存
+            for file_name in os.listdir(directory):
+                if file_name.startswith(prefix) and file_name.endswith(CACHE_SUFFIX):
+                    try:
+                        os.remove(os.path.join(directory, file_name))
+                    except FileNotFoundError:
+                        pass
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump((importlib.util.MAGIC_NUMBER, digest, scan_version) + entry, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # library 目录只读时只使用内存缓存
+            pass
@@ -1,11 +1,16 @@
 from collections import OrderedDict, defaultdict, namedtuple
 from datetime import date, datetime
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 import numpy as np
 import pandas as pd
+from pandas.io.parsers import TextFileReader
+from .streaming_stats import StreamingStats, summarize_chunks
 
 
 class DataSummarizer:
+    # 超过该行数的 DataFrame 只在随机样本上计算描述性统计(分位数为近似值)
+    SAMPLE_ROWS = 100_000
+
     @staticmethod
     def get_data_summary(data: Union[pd.DataFrame, Dict[str, pd.DataFrame], list, np.ndarray, tuple , set ,Any], max_depth: int = 5) -> str:
         if isinstance(data, dict) and all(isinstance(v, pd.DataFrame) for v in data.values()):
@@ -14,6 +19,12 @@ class DataSummarizer:
             return DataSummarizer.get_dict_summary(data)
         elif isinstance(data, pd.DataFrame):
             return DataSummarizer.get_dataframe_summary(data)
+        elif isinstance(data, TextFileReader):
+            # pd.read_csv(..., chunksize=N) 返回的分块读取器只能遍历一次，摘要不读取数据，
+            # 需要统计时对分块调用 get_chunked_dataframe_summary
+            return DataSummarizer.get_reader_summary(data)
+        elif isinstance(data, pd.Series):
+            return DataSummarizer.get_series_summary(data)
         elif isinstance(data, np.ndarray):
             return DataSummarizer.get_numpy_array_summary(data)
         elif isinstance(data, list):
@@ -76,29 +87,83 @@ class DataSummarizer:
         return summary
 
     @staticmethod
-    def get_dataframe_summary(df: pd.DataFrame) -> str:
+    def get_dataframe_summary(df: pd.DataFrame, sample_rows: Optional[int] = None) -> str:
+        """
+        :param sample_rows: 超过该行数时在随机样本上计算描述性统计，默认为 SAMPLE_ROWS，0 表示不抽样
+        """
+        if sample_rows is None:
+            sample_rows = DataSummarizer.SAMPLE_ROWS
+        sampled = df.sample(n=sample_rows, random_state=0) if sample_rows and len(df) > sample_rows else df
         summary = f"数据类型: pandas DataFrame\n"
         summary += f"形状: {df.shape}\n"
-        summary += f"列: {', '.join(df.columns)}\n"
+        summary += f"列: {', '.join(map(str, df.columns))}\n"
         summary += "数据类型:\n"
         for col, dtype in df.dtypes.items():
             summary += f"  {col}: {dtype}\n"
         summary += "样本数据 (前5行):\n"
         summary += df.head().to_string()
-        summary += "\n\n描述性统计:\n"
-        summary += df.describe(include='all').to_string()
+        if sampled is df:
+            summary += "\n\n描述性统计:\n"
+        else:
+            summary += f"\n\n描述性统计 (基于 {len(sampled)} 行随机样本，分位数为近似值):\n"
+        summary += sampled.describe(include='all').to_string()
         summary += "\n\n缺失值信息:\n"
         summary += df.isnull().sum().to_string()
         return summary
 
+    @staticmethod
+    def get_reader_summary(reader: TextFileReader) -> str:
+        summary = f"数据类型: 分块读取的 pandas DataFrame (尚未读取)\n"
+        summary += f"每块行数: {getattr(reader, 'chunksize', None)}\n"
+        return summary
+
+    @staticmethod
+    def get_chunked_dataframe_summary(chunks) -> str:
+        """
+        逐块汇总不能一次读入内存的 DataFrame，只遍历一次数据
+        会消耗传入的迭代器，调用方需要自己重新打开读取器
+        """
+        rows, stats, head = summarize_chunks(chunks)
+        summary = f"数据类型: 分块读取的 pandas DataFrame\n"
+        summary += f"行数: {rows}\n"
+        summary += f"列: {', '.join(map(str, stats))}\n"
+        if head is not None:
+            summary += "样本数据 (前5行):\n"
+            summary += head.to_string() + "\n"
+        summary += "各列统计:\n"
+        for column, column_stats in stats.items():
+            summary += f"  {column}:\n"
+            summary += "".join(line + "\n" for line in column_stats.to_lines(indent="    "))
+        return summary
+
+    @staticmethod
+    def get_series_summary(series: pd.Series) -> str:
+        summary = f"数据类型: pandas Series\n"
+        summary += f"名称: {series.name}\n"
+        summary += f"长度: {len(series)}\n"
+        summary += f"数据类型: {series.dtype}\n"
+        summary += f"样本数据 (前5行):\n{series.head().to_string()}\n"
+        summary += "描述性统计:\n"
+        summary += series.describe().to_string() + "\n"
+        return summary
+
     @staticmethod
     def get_numpy_array_summary(arr: np.ndarray) -> str:
         summary = f"数据类型: NumPy array\n"
         summary += f"形状: {arr.shape}\n"
         summary += f"数据类型: {arr.dtype}\n"
-        summary += f"样本数据 (前10个元素): {arr.flatten()[:10]}\n"
+        summary += f"样本数据 (前10个元素): {arr.ravel()[:10]}\n"
         summary += f"描述性统计:\n"
-        summary += f"  最小值: {np.min(arr)}\n"
+        if arr.size and (np.issubdtype(arr.dtype, np.number) or arr.dtype == np.bool_):
+            # 已经在内存中的数值数组直接用 NumPy 计算，比逐块的单次遍历统计快
+            summary += DataSummarizer.get_numeric_stats(arr)
+        elif arr.size:
+            summary += "".join(line + "\n" for line in StreamingStats().update_chunks(arr).to_lines())
+        return summary
+
+    @staticmethod
+    def get_numeric_stats(arr: np.ndarray) -> str:
+        summary = f"  最小值: {np.min(arr)}\n"
         summary += f"  最大值: {np.max(arr)}\n"
         summary += f"  平均值: {np.mean(arr)}\n"
         summary += f"  中位数: {np.median(arr)}\n"
@@ -110,12 +175,12 @@ class DataSummarizer:
         summary = f"数据类型: List\n"
         summary += f"长度: {len(data)}\n"
         summary += f"样本数据 (前10个元素): {data[:10]}\n"
-        if all(isinstance(item, (int, float)) for item in data):
+        if data and all(isinstance(item, (int, float)) for item in data):
             summary += "数值列表的描述性统计:\n"
-            summary += f"  最小值: {min(data)}\n"
-            summary += f"  最大值: {max(data)}\n"
-            summary += f"  平均值: {sum(data) / len(data)}\n"
-            summary += f"  中位数: {sorted(data)[len(data)//2]}\n"
+            summary += DataSummarizer.get_numeric_stats(np.asarray(data, dtype=np.float64))
+        elif data and all(isinstance(item, str) for item in data):
+            summary += "字符串列表的统计:\n"
+            summary += "".join(line + "\n" for line in StreamingStats().update_chunks(np.asarray(data, dtype=object)).to_lines())
         return summary
 
     @staticmethod
@@ -0,0 +1,289 @@
+"""
+在预热的子进程中执行步骤代码
+
+ASTCodeRunner 在主进程中 exec 步骤代码，步骤崩溃(段错误、内存耗尽)会让整个程序退出。
+ProcessCodeRunner 维护一组工作进程，每个进程启动时先导入 akshare/pandas/matplotlib 等耗时的模块，
+之后执行步骤时不再付出导入的时间。接口和 ASTCodeRunner.run 相同，可以直接替换。
+
+在 setting.ini 中配置:
+    code_runner_backend = process      # ast(默认，在主进程中执行) 或 process
+    code_runner_workers = 4            # 工作进程数量
+    code_runner_timeout = 600          # 单个步骤的最长执行时间(秒)，超时的工作进程被结束并重新启动
+    code_runner_cpu_limit = 300        # 单个步骤的 CPU 时间上限(秒)，只在 Linux/macOS 上生效
+    code_runner_memory_mb = 4096       # 工作进程的内存上限(MB)，只在 Linux/macOS 上生效
+
+数据传递:
+    DataFrame 通过 Arrow IPC 传递(安装了 pyarrow 时)，其他变量使用 pickle。
+    模块、函数等无法跨进程传递的变量不会传递。
+    llm_client 等服务对象不传递，由工作进程调用 service_factory 自己创建一份，llm_client 每个步骤重新创建。
+"""
+import atexit
+import importlib
+import multiprocessing
+import os
+import pickle
+import threading
+import types
+from queue import Queue
+from typing import Any, Dict, Iterable, List, Tuple
+
+DEFAULT_PRELOAD = ("pandas", "numpy", "matplotlib.pyplot", "akshare")
+SERVICE_VARS = ("llm_client", "llm_factory", "data_summarizer", "news_deduplicator")
+DEFAULT_SERVICE_FACTORY = "core.run_content:load_shared_vars"
+
+
+def _encode_value(value: Any) -> Tuple[str, bytes]:
+    try:
+        import pandas as pd
+        import pyarrow as pa
+        if isinstance(value, pd.DataFrame):
+            table = pa.Table.from_pandas(value)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return "arrow", sink.getvalue().to_pybytes()
+    except ImportError:
+        pass
+    except Exception:
+        # 列中有 Arrow 不支持的对象，改用 pickle
+        pass
+    return "pickle", pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_value(kind: str, data: bytes) -> Any:
+    if kind == "arrow":
+        import pyarrow as pa
+        return pa.ipc.open_stream(data).read_all().to_pandas()
+    return pickle.loads(data)
+
+
+def encode_vars(variables: Dict[str, Any], skip: Iterable[str] = ()) -> Tuple[Dict[str, Tuple[str, bytes]], List[str]]:
+    """
+    序列化变量，返回 (序列化结果, 无法传递的变量名)
+    """
+    skip = set(skip)
+    encoded = {}
+    dropped = []
+    for name, value in variables.items():
+        if name in skip or name.startswith("__"):
+            continue
+        if isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)):
+            continue
+        try:
+            encoded[name] = _encode_value(value)
+        except Exception:
+            dropped.append(name)
+    return encoded, dropped
+
+
+def decode_vars(encoded: Dict[str, Tuple[str, bytes]]) -> Dict[str, Any]:
+    return {name: _decode_value(kind, data) for name, (kind, data) in encoded.items()}
+
+
+def _load_factory(path: str):
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _set_memory_limit(memory_limit_mb: int):
+    try:
+        import resource
+    except ImportError:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+class CPULimitExceeded(Exception):
+    pass
+
+
+class _CPULimit:
+    """用 RLIMIT_CPU 的软限制限制单个步骤的 CPU 时间，超出时在步骤代码中抛出 CPULimitExceeded"""
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.resource = None
+        if seconds <= 0:
+            return
+        try:
+            import resource
+            import signal
+        except ImportError:
+            return
+        self.resource = resource
+
+        def on_limit(signum, frame):
+            raise CPULimitExceeded(f"步骤 CPU 时间超过 {self.seconds} 秒")
+
+        signal.signal(signal.SIGXCPU, on_limit)
+
+    def __enter__(self):
+        if self.resource:
+            usage = self.resource.getrusage(self.resource.RUSAGE_SELF)
+            _, hard = self.resource.getrlimit(self.resource.RLIMIT_CPU)
+            soft = int(usage.ru_utime + usage.ru_stime) + self.seconds
+            if hard != self.resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            self.resource.setrlimit(self.resource.RLIMIT_CPU, (soft, hard))
+        return self
+
+    def __exit__(self, *exc):
+        if self.resource:
+            _, hard = self.resource.getrlimit(self.resource.RLIMIT_CPU)
+            self.resource.setrlimit(self.resource.RLIMIT_CPU, (hard, hard))
+        return False
+
+
+def _worker_main(conn, preload: Tuple[str, ...], service_factory: str, cpu_limit: int, memory_limit_mb: int):
+    from .ast_code_runner import ASTCodeRunner
+    if memory_limit_mb > 0:
+        _set_memory_limit(memory_limit_mb)
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"工作进程预加载 {module_name} 失败: {e}")
+    runner = ASTCodeRunner()
+    limit = _CPULimit(cpu_limit)
+    services = None
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        kind, code, encoded, service_names, debug = message
+        runner.debug = debug
+        try:
+            step_vars = decode_vars(encoded)
+            if service_names:
+                if services is None:
+                    services = _load_factory(service_factory)()
+                step_vars.update({name: services[name] for name in service_names if name in services})
+                # LLM 客户端保存对话历史，工作进程复用时每个步骤使用新的客户端
+                if "llm_client" in service_names and "llm_client" not in services and "llm_factory" in services:
+                    step_vars["llm_client"] = services["llm_factory"].get_instance()
+            with limit:
+                if kind == "file":
+                    result = runner.run_file(code, step_vars)
+                else:
+                    result = runner.run(code, step_vars)
+            result["updated_vars"], dropped = encode_vars(result["updated_vars"], skip=service_names)
+            if dropped:
+                note = f"以下变量无法传回主进程: {', '.join(dropped)}"
+                result["debug"] = f"{result['debug']}\n{note}" if result["debug"] else note
+        except Exception as e:
+            result = {"output": "", "error": f"{type(e).__name__}: {str(e)}", "updated_vars": {}, "debug": None}
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, context, args):
+        self.conn, child_conn = context.Pipe()
+        # 不设置为 daemon，步骤代码中仍然可以使用多进程
+        self.process = context.Process(target=_worker_main, args=(child_conn,) + args, name="code-runner")
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, kill: bool = False):
+        if kill:
+            self.process.terminate()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ProcessCodeRunner:
+    """
+    工作进程池，run 可以在多个线程中同时调用，每次调用占用一个空闲的工作进程
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 600, cpu_limit: int = 0, memory_limit_mb: int = 0,
+                 preload: Tuple[str, ...] = DEFAULT_PRELOAD, service_factory: str = DEFAULT_SERVICE_FACTORY,
+                 service_names: Tuple[str, ...] = SERVICE_VARS, debug: bool = False):
+        self.timeout = timeout
+        self.service_names = tuple(service_names)
+        self.debug = debug
+        self._context = multiprocessing.get_context("spawn")
+        self._args = (tuple(preload), service_factory, cpu_limit, memory_limit_mb)
+        self._idle: "Queue[_Worker]" = Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(max(1, workers)):
+            self._add_worker()
+        atexit.register(self.close)
+
+    def _add_worker(self):
+        worker = _Worker(self._context, self._args)
+        with self._lock:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _replace_worker(self, worker: _Worker):
+        worker.stop(kill=True)
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            closed = self._closed
+        if not closed:
+            self._add_worker()
+
+    def run(self, code: str, global_vars: Dict[str, Any] = {}) -> Dict[str, Any]:
+        """与 ASTCodeRunner.run 相同的输入输出"""
+        return self._submit("code", code, global_vars)
+
+    def run_file(self, path: str, global_vars: Dict[str, Any] = {}) -> Dict[str, Any]:
+        """与 ASTCodeRunner.run_file 相同，工作进程使用自己的编译缓存"""
+        return self._submit("file", os.path.abspath(path), global_vars)
+
+    def _submit(self, kind: str, code: str, global_vars: Dict[str, Any]) -> Dict[str, Any]:
+        service_names = [name for name in self.service_names if name in global_vars]
+        encoded, dropped = encode_vars(global_vars, skip=service_names)
+        worker = self._idle.get()
+        try:
+            worker.conn.send((kind, code, encoded, service_names, self.debug))
+            if not worker.conn.poll(self.timeout):
+                self._replace_worker(worker)
+                worker = None
+                return {"output": "", "error": f"TimeoutError: 步骤执行超过 {self.timeout} 秒，工作进程已重启",
+                        "updated_vars": {}, "debug": None}
+            result = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            self._replace_worker(worker)
+            exitcode = worker.process.exitcode
+            worker = None
+            return {"output": "", "error": f"WorkerCrashed: 工作进程异常退出(exitcode={exitcode}): {e}",
+                    "updated_vars": {}, "debug": None}
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+        result["updated_vars"] = decode_vars(result["updated_vars"])
+        if dropped and self.debug:
+            note = f"以下变量无法传给工作进程: {', '.join(dropped)}"
+            result["debug"] = f"{result['debug']}\n{note}" if result["debug"] else note
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,155 @@
+"""
+步骤结果缓存
+
+data_retrieval 步骤的 save_data_to 输出按 (步骤代码, 参数值, required_data 内容) 计算哈希作为缓存键，
+代码和输入都没有变化、缓存也没有过期时直接读取缓存，不再重新获取数据。
+
+在 plan.json 的步骤中声明缓存时间(秒):
+    "cache_ttl": 3600
+没有声明的步骤使用 setting.ini 中的默认值，默认为 0 即不缓存:
+    step_cache_ttl = 0
+    step_cache_dir = ./output/step_cache
+
+DataFrame/Series 保存为 Parquet(需要 pyarrow)，其他值只缓存能用 JSON 原样还原的值，
+不使用 pickle，缓存文件被修改也不会执行任意代码。无法安全保存的值不缓存，
+比如 int 为键的字典、tuple 经过 JSON 后会变成 str 键和 list，这样的值也不缓存。
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+import pandas as pd
+from ..utils.config_setting import Config
+
+DEFAULT_CACHE_DIR = "./output/step_cache"
+
+
+def hash_value(value: Any) -> str:
+    """计算 required_data 的内容哈希，同样内容的 DataFrame 得到同样的哈希"""
+    digest = hashlib.sha256()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode("utf-8"))
+        digest.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode("utf-8"))
+        try:
+            digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        except TypeError:
+            # 包含 list/dict 等不可哈希的单元格
+            digest.update(value.to_json(date_format="iso", default_handler=repr).encode("utf-8"))
+    else:
+        digest.update(json.dumps(value, sort_keys=True, ensure_ascii=False, default=repr).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class StepCache:
+    """
+    用法:
+        step_cache = StepCache()
+        ttl = step_cache.get_ttl(step)
+        key = step_cache.make_key(code, parameter_values, {name: value})
+        hit, data = step_cache.load(key, ttl)
+        if not hit:
+            ...
+            step_cache.save(key, step["save_data_to"], data)
+    """
+
+    def __init__(self, cache_dir: str = "", default_ttl: Optional[int] = None):
+        config = Config()
+        if not cache_dir:
+            cache_dir = config.get("step_cache_dir") if config.has_key("step_cache_dir") else DEFAULT_CACHE_DIR
+        if default_ttl is None:
+            default_ttl = int(config.get("step_cache_ttl")) if config.has_key("step_cache_ttl") else 0
+        self.cache_dir = cache_dir
+        self.default_ttl = default_ttl
+
+    def get_ttl(self, step: Dict[str, Any]) -> int:
+        """
+        只有带 save_data_to 的 data_retrieval 步骤可以缓存，返回 0 表示不缓存
+        data_analysis 步骤的 analysis_result 不在缓存中，命中缓存会使报告缺少这一步的分析
+        """
+        if step.get("type") != "data_retrieval" or "save_data_to" not in step:
+            return 0
+        return int(step.get("cache_ttl", self.default_ttl))
+
+    @staticmethod
+    def make_key(code: str, parameter_values: Dict[str, Any], inputs: Dict[str, Any]) -> str:
+        digest = hashlib.sha256()
+        digest.update(code.encode("utf-8"))
+        digest.update(json.dumps(parameter_values, sort_keys=True, ensure_ascii=False, default=repr).encode("utf-8"))
+        for name in sorted(inputs):
+            digest.update(name.encode("utf-8"))
+            digest.update(hash_value(inputs[name]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    def load(self, key: str, ttl: int) -> Tuple[bool, Any]:
+        """返回 (是否命中, 缓存的值)"""
+        meta_path = self._path(key, ".json")
+        if ttl <= 0 or not os.path.exists(meta_path):
+            return False, None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - meta["created"] > ttl:
+                return False, None
+            if meta["format"] == "json":
+                return True, meta["value"]
+            data = pd.read_parquet(self._path(key, ".parquet"))
+            if meta["format"] == "series":
+                data = data.iloc[:, 0].rename(meta.get("series_name"))
+            return True, data
+        except Exception as e:
+            print(f"读取步骤缓存 {key} 失败: {e}")
+            return False, None
+
+    def save(self, key: str, name: str, value: Any) -> bool:
+        """保存缓存，值无法安全序列化时返回 False"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta = {"name": name, "created": time.time()}
+        try:
+            if isinstance(value, (pd.DataFrame, pd.Series)):
+                if isinstance(value, pd.Series):
+                    meta["format"] = "series"
+                    meta["series_name"] = value.name
+                    value = value.to_frame(name="value")
+                else:
+                    meta["format"] = "dataframe"
+                # 先写临时文件再替换，多个线程同时执行相同步骤时不会读到写了一半的文件
+                data_path = self._path(key, ".parquet")
+                value.to_parquet(data_path + ".tmp")
+                os.replace(data_path + ".tmp", data_path)
+            else:
+                meta["format"] = "json"
+                meta["value"] = value
+            text = json.dumps(meta, ensure_ascii=False)
+            if meta["format"] == "json" and json.loads(text)["value"] != value:
+                raise TypeError("value changes after a JSON round trip")
+        except Exception as e:
+            print(f"步骤结果 {name} 无法缓存: {e}")
+            return False
+        meta_path = self._path(key, ".json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(meta_path + ".tmp", meta_path)
+        return True
+
+    def clear(self, max_age: Optional[float] = None) -> int:
+        """删除缓存，max_age 不为空时只删除超过该时间(秒)的缓存，返回删除的条目数"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        removed = 0
+        now = time.time()
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".json"):
+                continue
+            key = file_name[:-len(".json")]
+            meta_path = self._path(key, ".json")
+            if max_age is not None and now - os.path.getmtime(meta_path) <= max_age:
+                continue
+            for path in (meta_path, self._path(key, ".parquet")):
+                if os.path.exists(path):
+                    os.remove(path)
+            removed += 1
+        return removed
@@ -0,0 +1,108 @@
+"""
+步骤之间传递数据的存储
+
+save_data_to 的输出保存在 StepDataStore 中，后面的步骤通过 required_data 拿到的是浅拷贝视图。
+pandas 开启写时复制(Copy-on-Write)后，浅拷贝和原数据共享内存，
+只有步骤修改某一列时才复制这一列，几百MB的分钟线数据不会在每个步骤中复制一份，
+步骤修改自己拿到的数据也不会影响其他步骤。
+
+pandas 3 默认开启写时复制。pandas 2 的写时复制是进程级的选项，会改变所有代码的链式赋值行为，
+StepDataStore 不会自己开启，由入口程序启动时按 setting.ini 调用 configure_copy_on_write 开启:
+    pandas_copy_on_write = true
+没有开启写时复制时直接传递原对象，不做任何复制(步骤之间共享同一个对象)。
+"""
+import threading
+from typing import Any, Dict, Iterable, List
+import pandas as pd
+
+
+def copy_on_write_enabled() -> bool:
+    """pandas 是否已经开启写时复制"""
+    major = int(pd.__version__.split(".")[0])
+    if major >= 3:
+        return True
+    if major == 2:
+        return pd.get_option("mode.copy_on_write") is True
+    return False
+
+
+def enable_copy_on_write() -> bool:
+    """开启 pandas 写时复制(影响整个进程)，返回是否可用"""
+    if int(pd.__version__.split(".")[0]) == 2:
+        pd.set_option("mode.copy_on_write", True)
+    return copy_on_write_enabled()
+
+
+def configure_copy_on_write() -> bool:
+    """入口程序启动时调用，setting.ini 中 pandas_copy_on_write = true 时开启写时复制"""
+    from ..utils.config_setting import Config
+    config = Config()
+    if config.has_key("pandas_copy_on_write") and config.get("pandas_copy_on_write").strip().lower() in ("true", "1", "yes"):
+        return enable_copy_on_write()
+    return copy_on_write_enabled()
+
+
+class StepDataStore:
+    """
+    用法和 dict 相同:
+        saved_data[step["save_data_to"]] = data
+        df = saved_data.get("stock_data")     # 只读视图，修改时才复制
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.copy_on_write = copy_on_write_enabled()
+
+    def _view(self, value: Any) -> Any:
+        # 没有开启写时复制时和原来一样直接传递对象，不复制
+        if self.copy_on_write and isinstance(value, (pd.DataFrame, pd.Series)):
+            return value.copy(deep=False)
+        return value
+
+    def put(self, name: str, value: Any):
+        with self._lock:
+            self._data[name] = self._view(value)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        with self._lock:
+            if name not in self._data:
+                return default
+            value = self._data[name]
+        return self._view(value)
+
+    def views(self, names: Iterable[str]) -> Dict[str, Any]:
+        """返回多个变量的视图，不存在的变量为 None"""
+        return {name: self.get(name) for name in names}
+
+    def __setitem__(self, name: str, value: Any):
+        self.put(name, value)
+
+    def __getitem__(self, name: str) -> Any:
+        with self._lock:
+            value = self._data[name]
+        return self._view(value)
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """每个 DataFrame/Series 占用的内存(字节)"""
+        with self._lock:
+            items = list(self._data.items())
+        result = {}
+        for name, value in items:
+            if isinstance(value, pd.DataFrame):
+                result[name] = int(value.memory_usage(index=True).sum())
+            elif isinstance(value, pd.Series):
+                result[name] = int(value.memory_usage(index=True))
+        return result
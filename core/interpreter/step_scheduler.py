@@ -0,0 +1,131 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+
+class StepScheduler:
+    """
+    按 plan.json 中 save_data_to / required_data 的依赖关系并行执行步骤
+
+    依赖规则:
+    1. 步骤依赖于 required_data 中每个变量最近一次的 save_data_to 步骤
+    2. data_analysis 步骤之间保持原有顺序(它们可能共用 analysis_result 等未声明的变量)
+    3. 没有声明 required_data 的 data_analysis 步骤依赖之前的所有步骤
+    没有依赖关系的步骤(比如多个 data_retrieval)在线程池中同时执行
+    """
+
+    def __init__(self, steps: List[Dict[str, Any]], max_workers: int = 8):
+        self.steps = {step["step_number"]: step for step in steps}
+        self.order = [step["step_number"] for step in steps]
+        self.max_workers = max(1, max_workers)
+        self.dependencies = self.build_dependencies(steps)
+        self.timings: Dict[int, Tuple[float, float]] = {}
+        self.elapsed = 0.0
+
+    @staticmethod
+    def build_dependencies(steps: List[Dict[str, Any]]) -> Dict[int, Set[int]]:
+        dependencies: Dict[int, Set[int]] = {}
+        producers: Dict[str, int] = {}
+        last_analysis = None
+        previous: List[int] = []
+        for step in steps:
+            number = step["step_number"]
+            deps = set()
+            required = step.get("required_data", [])
+            for name in required:
+                if name in producers:
+                    deps.add(producers[name])
+            if step["type"] == "data_analysis":
+                if not required:
+                    deps.update(previous)
+                if last_analysis is not None:
+                    deps.add(last_analysis)
+                last_analysis = number
+            dependencies[number] = deps
+            if "save_data_to" in step:
+                producers[step["save_data_to"]] = number
+            previous.append(number)
+        return dependencies
+
+    def run(self, execute: Callable[[Dict[str, Any]], Any]) -> Dict[int, Any]:
+        """
+        执行所有步骤，execute(step) 在工作线程中被调用
+        某个步骤抛出异常时不再启动新的步骤，等待正在执行的步骤结束后重新抛出
+        """
+        results: Dict[int, Any] = {}
+        done: Set[int] = set()
+        started: Set[int] = set()
+        errors: List[BaseException] = []
+        start_time = time.time()
+
+        def timed(step):
+            step_start = time.time() - start_time
+            try:
+                return execute(step)
+            finally:
+                self.timings[step["step_number"]] = (step_start, time.time() - start_time)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plan-step") as executor:
+            futures = {}
+
+            def submit_ready():
+                for number in self.order:
+                    if number not in started and self.dependencies[number] <= done:
+                        started.add(number)
+                        # 在调用方的上下文中执行，步骤能看到 code_tools 的命名空间等上下文变量
+                        context = contextvars.copy_context()
+                        futures[executor.submit(context.run, timed, self.steps[number])] = number
+
+            submit_ready()
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    number = futures.pop(future)
+                    try:
+                        results[number] = future.result()
+                    except BaseException as e:
+                        errors.append(e)
+                    done.add(number)
+                if not errors:
+                    submit_ready()
+
+        self.elapsed = time.time() - start_time
+        if errors:
+            raise errors[0]
+        return results
+
+    def critical_path(self) -> Tuple[List[int], float]:
+        """按实际耗时计算关键路径，返回 (步骤编号列表, 总耗时)"""
+        finish: Dict[int, float] = {}
+        parent: Dict[int, int] = {}
+        for number in self.order:
+            if number not in self.timings:
+                continue
+            duration = self.timings[number][1] - self.timings[number][0]
+            best = 0.0
+            for dep in self.dependencies[number]:
+                if dep in finish and finish[dep] > best:
+                    best = finish[dep]
+                    parent[number] = dep
+            finish[number] = best + duration
+        if not finish:
+            return [], 0.0
+        last = max(finish, key=finish.get)
+        path = [last]
+        while path[-1] in parent:
+            path.append(parent[path[-1]])
+        return path[::-1], finish[last]
+
+    def report(self) -> str:
+        lines = ["步骤耗时:"]
+        for number in self.order:
+            if number in self.timings:
+                start, end = self.timings[number]
+                deps = ",".join(str(dep) for dep in sorted(self.dependencies[number])) or "-"
+                lines.append(f"  步骤 {number}: {end - start:.2f} 秒 (开始 {start:.2f}s, 依赖 {deps})")
+        total = sum(end - start for start, end in self.timings.values())
+        path, length = self.critical_path()
+        lines.append(f"总耗时: {self.elapsed:.2f} 秒, 步骤耗时合计: {total:.2f} 秒, 并行数: {self.max_workers}")
+        lines.append(f"关键路径: {' -> '.join(str(number) for number in path)} ({length:.2f} 秒)")
+        return "\n".join(lines)
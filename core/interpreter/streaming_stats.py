@@ -0,0 +1,248 @@
+"""
+单遍、内存有界的流式统计
+
+DataSummarizer 对数组、列表、Series 和分块读取的 DataFrame 只遍历一次数据，按块更新下面的统计量:
+    RunningMoments   数量/最小值/最大值/平均值/标准差 (Welford，按块用 Chan 的公式合并)
+    TDigest          分位数，数据量不超过 buffer_size 时精确计算，超过后压缩为 t-digest
+    HyperLogLog      不同值的数量(近似，标准误差约 1.04/sqrt(2^p))
+    TopK             出现次数最多的值 (Misra-Gries，计数为下界)
+所有结构都可以逐块 update，内存只和参数有关，和数据量无关。
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+class RunningMoments:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        n = values.size
+        if n == 0:
+            return
+        chunk_mean = float(values.mean())
+        chunk_m2 = float(((values - chunk_mean) ** 2).sum())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    @property
+    def std(self) -> float:
+        # 与 np.std 一致，使用总体标准差
+        return float(np.sqrt(self.m2 / self.count)) if self.count else float("nan")
+
+
+class TDigest:
+    """
+    合并式 t-digest，使用 k1 尺度函数，两端的簇更小，尾部分位数更准确
+    :param compression: 簇数量约为 compression / 2
+    :param buffer_size: 缓冲的原始值数量，总数据量不超过该值时分位数是精确的
+    """
+
+    def __init__(self, compression: int = 200, buffer_size: int = 10_000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+        self.exact = True
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self._buffer.append(values.astype(np.float64, copy=False))
+        self._buffered += values.size
+        if self._buffered > self.buffer_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        values = np.concatenate(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self.exact = False
+        # 先把新数据单独压缩成簇，再和已有的簇合并，排序只发生在一块数据内
+        means, weights = self._compress(np.sort(values), np.ones(values.size))
+        means, weights = np.concatenate([self.means, means]), np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="mergesort")
+        self.means, self.weights = self._compress(means[order], weights[order])
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # means 已经排序
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        group = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, np.diff(group) != 0])
+        group_weights = np.add.reduceat(weights, starts)
+        return np.add.reduceat(means * weights, starts) / group_weights, group_weights
+
+    def quantile(self, q: float) -> float:
+        if self.exact:
+            if not self._buffer:
+                return float("nan")
+            return float(np.quantile(np.concatenate(self._buffer), q))
+        self._flush()
+        cumulative = np.cumsum(self.weights)
+        centers = (cumulative - self.weights / 2) / cumulative[-1]
+        return float(np.interp(q, centers, self.means))
+
+
+class HyperLogLog:
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, values: np.ndarray):
+        if values.size == 0:
+            return
+        hashes = pd.util.hash_array(values)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # 剩余位中第一个 1 的位置，rest 为 0 时取最大值
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = np.where(rest == 0, 64 - self.p + 1, 64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * np.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class TopK:
+    """
+    Misra-Gries 频繁项，最多保留 capacity 个计数器，可以按块合并
+    出现次数超过 总数/(capacity+1) 的值一定会被保留
+    """
+
+    def __init__(self, k: int = 5, capacity: int = 100):
+        self.k = k
+        self.capacity = max(capacity, k)
+        self.counts: Dict[Any, int] = {}
+
+    def update(self, values: np.ndarray):
+        if values.size == 0:
+            return
+        for value, count in pd.Series(values).value_counts(dropna=True).items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.capacity:
+            threshold = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = {value: count - threshold for value, count in self.counts.items() if count > threshold}
+
+    def top(self) -> List[Tuple[Any, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:self.k]
+
+
+class StreamingStats:
+    """
+    按块更新的汇总统计，数值数据计算矩和分位数，所有数据计算不同值数量和高频值
+    """
+
+    def __init__(self, top_k: int = 5, distinct: bool = True):
+        self.moments = RunningMoments()
+        self.digest = TDigest()
+        self.hll = HyperLogLog() if distinct else None
+        self.top = TopK(top_k) if top_k else None
+        self.count = 0
+        self.missing = 0
+        self.numeric = True
+
+    def update(self, values: Any):
+        values = np.asarray(values)
+        if values.dtype == object or values.dtype.kind in "US":
+            series = pd.Series(values.ravel())
+            numeric = pd.to_numeric(series, errors="coerce")
+            is_numeric = bool(numeric.notna().sum() == series.notna().sum())
+            if is_numeric:
+                values = numeric.to_numpy(dtype=np.float64)
+        else:
+            is_numeric = values.dtype.kind in "biuf"
+        values = values.ravel()
+        self.count += values.size
+        missing = pd.isna(values)
+        self.missing += int(missing.sum())
+        present = values[~missing]
+        if is_numeric:
+            numbers = present.astype(np.float64, copy=False)
+            self.moments.update(numbers)
+            self.digest.update(numbers)
+        else:
+            self.numeric = False
+        if self.hll is not None:
+            try:
+                self.hll.update(present)
+            except TypeError:
+                # 包含 list/dict 等不可哈希的值
+                self.hll = None
+        if self.top is not None and not is_numeric:
+            try:
+                self.top.update(present)
+            except TypeError:
+                self.top = None
+
+    def update_chunks(self, values: Any, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "StreamingStats":
+        values = np.asarray(values).ravel()
+        for start in range(0, max(values.size, 1), chunk_size):
+            self.update(values[start:start + chunk_size])
+        return self
+
+    def quantile(self, q: float) -> float:
+        return self.digest.quantile(q)
+
+    def to_lines(self, indent: str = "  ") -> List[str]:
+        lines = []
+        if self.numeric and self.moments.count:
+            approx = "" if self.digest.exact else " (近似)"
+            lines += [
+                f"{indent}最小值: {self.moments.min}",
+                f"{indent}最大值: {self.moments.max}",
+                f"{indent}平均值: {self.moments.mean}",
+                f"{indent}中位数{approx}: {self.quantile(0.5)}",
+                f"{indent}标准差: {self.moments.std}",
+                f"{indent}25%/75% 分位数{approx}: {self.quantile(0.25)} / {self.quantile(0.75)}",
+            ]
+        if self.missing:
+            lines.append(f"{indent}缺失值: {self.missing}")
+        if self.hll is not None:
+            lines.append(f"{indent}不同值数量 (近似): {self.hll.count()}")
+        if self.top is not None and self.top.counts:
+            top = ", ".join(f"{value}({count})" for value, count in self.top.top())
+            lines.append(f"{indent}高频值: {top}")
+        return lines
+
+
+def summarize_chunks(chunks: Iterable[pd.DataFrame], top_k: int = 5) -> Tuple[int, Dict[str, StreamingStats], Optional[pd.DataFrame]]:
+    """
+    逐块汇总 DataFrame，返回 (总行数, 每列的统计, 第一块的前5行)
+    """
+    rows = 0
+    stats: Dict[str, StreamingStats] = {}
+    head = None
+    for chunk in chunks:
+        if head is None:
+            head = chunk.head()
+        rows += len(chunk)
+        for column in chunk.columns:
+            if column not in stats:
+                stats[column] = StreamingStats(top_k=top_k)
+            stats[column].update(chunk[column].to_numpy())
+    return rows, stats, head
@@ -0,0 +1,164 @@
+"""
+计划运行任务的队列和工作线程池
+
+每个任务在线程池中调用 run_content，运行过程中的事件(步骤开始/输出/结束、最终报告)保存在任务中，
+HTTP 服务可以随时查询状态，或者按 SSE 持续读取新的事件。
+LLM 工厂、代码执行器和步骤缓存在第一个任务运行时创建，之后所有任务共享；
+LLM 客户端会保存对话历史，由 run_content 为每个任务单独创建，并发的任务之间不会互相影响。
+
+ast 执行器在同一个进程的多个线程中执行步骤，matplotlib/pyplot 等模块的全局状态是共享的，
+并发的任务会互相混入或关闭对方的图表。因此 max_workers > 1 时步骤总是在 process 执行器的
+工作进程中运行(忽略 code_runner_backend = ast)；需要使用 ast 执行器时把 api_workers 设为 1，任务按顺序运行。
+步骤在工作进程中执行，ASTCodeRunner.run_sse 无法使用，SSE 的事件来自 run_content 的 on_event 回调。
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class Job:
+    def __init__(self, index: int, params: Dict[str, str]):
+        self.id = uuid.uuid4().hex
+        self.index = index
+        self.params = params
+        self.status = "queued"      # queued / running / success / error
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.report: Optional[str] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._condition = threading.Condition()
+
+    def add_event(self, event: Dict[str, Any]):
+        with self._condition:
+            self.events.append(event)
+            self._condition.notify_all()
+
+    def set_status(self, status: str, **kwargs):
+        with self._condition:
+            self.status = status
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+            self.events.append({"type": "status", "status": status})
+            self._condition.notify_all()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("success", "error")
+
+    def iter_events(self, start: int = 0, heartbeat: float = 15) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        从第 start 个事件开始依次返回事件，任务结束后停止
+        heartbeat 秒内没有新事件时返回 None，调用方可以发送心跳保持连接
+        """
+        position = start
+        while True:
+            with self._condition:
+                if position >= len(self.events) and not self.done:
+                    self._condition.wait(heartbeat)
+                events = self.events[position:]
+                done = self.done
+            position += len(events)
+            if not events and not done:
+                yield None
+            for event in events:
+                yield event
+            if done and position >= len(self.events):
+                return
+
+    def to_dict(self, with_events: bool = False) -> Dict[str, Any]:
+        result = {
+            "id": self.id,
+            "index": self.index,
+            "params": self.params,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "report": self.report,
+            "error": self.error,
+            "event_count": len(self.events),
+        }
+        if with_events:
+            result["events"] = list(self.events)
+        return result
+
+
+class JobManager:
+    """
+    :param max_workers: 同时运行的计划数量，超出的任务排队；大于 1 时使用 process 执行器
+    :param max_jobs: 保留的任务数量，超出后删除最早结束的任务
+    :param run_func: 执行计划的函数，默认为 run_content
+    """
+
+    def __init__(self, max_workers: int = 4, max_jobs: int = 100, run_func: Optional[Callable[..., Any]] = None):
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="plan-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._run_func = run_func
+        self._shared: Optional[Dict[str, Any]] = None
+        self._warm_lock = threading.Lock()
+
+    def _get_shared(self) -> Dict[str, Any]:
+        with self._warm_lock:
+            if self._shared is None:
+                if self._run_func is not None:
+                    self._shared = {}
+                else:
+                    from core.run_content import load_shared_vars, create_code_runner
+                    from core.interpreter.step_cache import StepCache
+                    self._shared = {
+                        "global_vars": load_shared_vars(),
+                        "runner": create_code_runner("process" if self.max_workers > 1 else None),
+                        "step_cache": StepCache(),
+                    }
+            return self._shared
+
+    def submit(self, index: int, params: Optional[Dict[str, str]] = None) -> Job:
+        job = Job(index, params or {})
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        job.set_status("running", started=time.time())
+        try:
+            run_func = self._run_func
+            if run_func is None:
+                from core.run_content import run_content
+                run_func = run_content
+            report = run_func(job.index, job.params, on_event=job.add_event, **self._get_shared())
+            job.set_status("success", report=report, finished=time.time())
+        except Exception as e:
+            job.set_status("error", error=f"{type(e).__name__}: {str(e)}", finished=time.time())
+
+    def _trim(self):
+        # 调用方需要持有 self._lock，只删除已经结束的任务
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].done:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        shared = self._shared or {}
+        runner = shared.get("runner")
+        if runner is not None and hasattr(runner, "close"):
+            runner.close()
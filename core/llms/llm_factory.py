@@ -1,30 +1,29 @@
 import os
-import re
 import importlib
 from typing import Any, Dict, Type
 from ..utils.single_ton import Singleton
 from ..utils.config_setting import Config
+from ..utils.class_registry import discover_classes
 from ._llm_api_client import LLMApiClient
 from ..utils.log import logger
 
 class LLMFactory(metaclass=Singleton):
+    # 实现类的类名，匹配结果按文件修改时间缓存在 __pycache__/class_registry.json 中
+    CLASS_PATTERN = r'class\s+(\w+)\s*\([^)]*LLMApiClient[^)]*\):'
+
     def __init__(self):
         self.llm_classes: Dict[str, str] = {}  # 存储类名和文件名的映射
         self._discover_llm_classes()
         self._stop_words = None
 
-    def _discover_llm_classes(self):
+    @classmethod
+    def discover(cls, rebuild: bool = False) -> Dict[str, str]:
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        llm_api_client_pattern = re.compile(r'class\s+(\w+)\s*\([^)]*LLMApiClient[^)]*\):')
-        
-        for filename in os.listdir(current_dir):
-            if filename.endswith('.py') and not filename.startswith('_'):
-                file_path = os.path.join(current_dir, filename)
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    matches = llm_api_client_pattern.findall(content)
-                    for class_name in matches:
-                        self.llm_classes[class_name.lower()] = filename[:-3]  # 存储类名和模块名的映射
+        classes = discover_classes(current_dir, cls.CLASS_PATTERN, rebuild)
+        return {class_name.lower(): module_name for class_name, module_name in classes.items()}  # 存储类名和模块名的映射
+
+    def _discover_llm_classes(self):
+        self.llm_classes.update(self.discover())
 
     def get_instance(self, name: str = "",**kwargs) -> LLMApiClient:
         config = Config()
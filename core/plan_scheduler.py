@@ -0,0 +1,138 @@
+"""
+定时运行 agenda 中的计划
+
+json/agenda.json 中配置了 schedule(crontab 格式)的计划会在一个常驻进程中定时运行:
+    "schedule": "*/15 * * * *"
+LLM 工厂、新闻去重索引、代码执行器和步骤缓存在第一次运行时创建，之后所有运行共享，
+不用每次 python run.py N 都重新导入模块。LLM 客户端保存对话历史，每次运行单独创建。
+
+同一个计划上一次还没有运行完时跳过本次运行(max_instances=1)，错过的多次运行只补跑一次(coalesce)。
+每次运行的结果追加到 ./output/scheduler_history.jsonl，报告保存在 ./output/reports。
+
+用法:
+    python scheduler.py               # 运行所有配置了 schedule 的计划
+    python scheduler.py 2 3           # 只运行指定的计划
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.cron import CronTrigger
+from core.utils.config_setting import Config
+
+HISTORY_FILE = "./output/scheduler_history.jsonl"
+REPORT_DIR = "./output/reports"
+
+
+class PlanScheduler:
+    def __init__(self, max_workers: int = 4, history_size: int = 200):
+        self.scheduler = BlockingScheduler(executors={"default": ThreadPoolExecutor(max_workers)},
+                                           job_defaults={"max_instances": 1, "coalesce": True,
+                                                         "misfire_grace_time": 60})
+        self.scheduler.add_listener(self._on_skipped, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+        self.history: deque = deque(maxlen=history_size)
+        self._history_lock = threading.Lock()
+        self._global_vars = None
+        self._runner = None
+        self._step_cache = None
+        self._warm_lock = threading.Lock()
+
+    def _warm_up(self):
+        # 第一次运行时创建共享对象，之后所有运行复用
+        with self._warm_lock:
+            if self._global_vars is None:
+                from core.run_content import load_shared_vars, create_code_runner
+                from core.interpreter.step_cache import StepCache
+                self._global_vars = load_shared_vars()
+                self._runner = create_code_runner()
+                self._step_cache = StepCache()
+
+    @staticmethod
+    def load_agenda() -> List[Dict[str, Any]]:
+        with open('./json/agenda.json', 'r', encoding='utf-8') as agenda_file:
+            return json.load(agenda_file)
+
+    def add_agenda(self, indexes: Optional[List[int]] = None) -> int:
+        """把配置了 schedule 的计划加入调度，返回加入的数量"""
+        count = 0
+        for item in self.load_agenda():
+            if not item.get("schedule") or (indexes and item["index"] not in indexes):
+                continue
+            self.scheduler.add_job(self.run_plan, CronTrigger.from_crontab(item["schedule"]),
+                                   args=[item["index"]], id=f"plan_{item['index']}", name=item["key"],
+                                   replace_existing=True)
+            print(f"计划 {item['index']} 按 {item['schedule']} 定时运行: {item['key']}")
+            count += 1
+        return count
+
+    def run_plan(self, index: int, cmd_args: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        from core.run_content import run_content
+        self._warm_up()
+        start_time = time.time()
+        record = {"index": index, "start": datetime.fromtimestamp(start_time).isoformat(timespec="seconds")}
+        try:
+            report = run_content(index, cmd_args or {}, global_vars=self._global_vars,
+                                 runner=self._runner, step_cache=self._step_cache)
+            record["status"] = "success"
+            record["report"] = self._save_report(index, start_time, report)
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {str(e)}"
+        record["elapsed"] = round(time.time() - start_time, 2)
+        self._add_history(record)
+        print(f"计划 {index} 运行结束: {record['status']}，耗时 {record['elapsed']} 秒")
+        return record
+
+    @staticmethod
+    def _save_report(index: int, start_time: float, report: Any) -> str:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        path = os.path.join(REPORT_DIR, f"plan_{index}_{datetime.fromtimestamp(start_time).strftime('%Y%m%d_%H%M%S')}.md")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(str(report))
+        return path
+
+    def _on_skipped(self, event):
+        index = int(event.job_id.split("_")[-1])
+        status = "skipped" if event.code == EVENT_JOB_MAX_INSTANCES else "missed"
+        self._add_history({"index": index, "start": datetime.now().isoformat(timespec="seconds"), "status": status})
+        print(f"计划 {index} 上一次运行还没有结束，跳过本次运行" if status == "skipped" else f"计划 {index} 错过了运行时间")
+
+    def _add_history(self, record: Dict[str, Any]):
+        with self._history_lock:
+            self.history.append(record)
+            os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+            with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def start(self):
+        try:
+            self.scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            if self._runner is not None and hasattr(self._runner, "close"):
+                self._runner.close()
+
+
+def main():
+    from core.interpreter.step_data_store import configure_copy_on_write
+    configure_copy_on_write()
+    config = Config()
+    max_workers = int(config.get("scheduler_workers")) if config.has_key("scheduler_workers") else 4
+    indexes = [int(arg) for arg in sys.argv[1:]]
+    plan_scheduler = PlanScheduler(max_workers=max_workers)
+    if not plan_scheduler.add_agenda(indexes):
+        print("agenda.json 中没有配置 schedule 的计划")
+        return
+    plan_scheduler.start()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,157 @@
 import os
 import json
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from core.llms.llm_factory import LLMFactory
 from core.interpreter.ast_code_runner import ASTCodeRunner
 from core.interpreter.data_summarizer import DataSummarizer
+from core.interpreter.step_data_store import StepDataStore, configure_copy_on_write
+from core.interpreter.step_scheduler import StepScheduler
+from core.interpreter.step_cache import StepCache
+from core.utils.news_dedup import NewsDeduplicator
 from core.utils.code_tools_required import add_required_tools
+from core.utils.code_tools import code_tools
+from core.utils.config_setting import Config
 
-def load_global_vars():
-    llm_factory = LLMFactory()
-    llm_client = llm_factory.get_instance()
-    data_summarizer = DataSummarizer()
+def load_shared_vars():
+    """多次运行之间可以共享的对象，常驻进程(定时任务、HTTP 服务)只创建一次"""
     return {
-        'llm_client': llm_client,
-        'llm_factory': llm_factory,
-        'data_summarizer': data_summarizer
+        'llm_factory': LLMFactory(),
+        'data_summarizer': DataSummarizer(),
+        'news_deduplicator': NewsDeduplicator()
     }
 
-def execute_step(step, global_vars, saved_data, runner, analysis_results):
+def load_run_vars(shared_vars):
+    """每次运行单独创建 LLM 客户端，客户端会记录对话历史，不能在运行之间或者并发的运行之间共享"""
+    return {**shared_vars, 'llm_client': shared_vars['llm_factory'].get_instance()}
+
+def load_global_vars():
+    return load_run_vars(load_shared_vars())
+
+_vars_lock = threading.Lock()
+
+def emit_event(on_event, event_type, **kwargs):
+    """把运行过程中的事件交给 on_event 回调，比如 HTTP 服务的 SSE 输出"""
+    if on_event:
+        on_event({"type": event_type, **kwargs})
+
+def execute_step(step, global_vars, saved_data, runner, analysis_results, step_cache=None, on_event=None):
+    """
+    执行单个步骤，可以在多个线程中同时调用
+    步骤在 global_vars 的快照上执行，结束后再把更新的变量合并回 global_vars
+    声明了 cache_ttl 的步骤在代码、参数和输入数据都没有变化时直接使用 step_cache 中的结果
+    on_event 收到 step_start/step_output/analysis_result/step_end 事件
+    """
     step_code_path = step["step_code_path"]
     if not os.path.exists(step_code_path):
         raise FileNotFoundError(f"{step_code_path} not found")
 
-    print(f"Executing step {step['step_number']}: {step['description']}")
-    print(f"Running code from: {step_code_path}")
+    print(f"Executing step {step['step_number']}: {step['description']}\nRunning code from: {step_code_path}")
 
     start_time = time.time()
+    emit_event(on_event, "step_start", step=step['step_number'], description=step['description'])
     
     with open(step_code_path, 'r', encoding='utf-8') as file:
         code = file.read()
 
-    for required_data in step.get("required_data", []):
-        global_vars[required_data] = saved_data.get(required_data)
+    with _vars_lock:
+        step_vars = dict(global_vars)
+        for required_data in step.get("required_data", []):
+            step_vars[required_data] = saved_data.get(required_data)
+    step_vars.update(step.get("parameter_values", {}))
 
-    result = runner.run(code, global_vars)
-    
+    cache_key = None
+    cache_ttl = step_cache.get_ttl(step) if step_cache else 0
+    if cache_ttl > 0:
+        inputs = {name: step_vars.get(name) for name in step.get("required_data", [])}
+        cache_key = step_cache.make_key(code, step.get("parameter_values", {}), inputs)
+        hit, data = step_cache.load(cache_key, cache_ttl)
+        if hit:
+            with _vars_lock:
+                global_vars[step["save_data_to"]] = data
+                saved_data[step["save_data_to"]] = data
+            print(f"Step {step['step_number']} output:\n使用缓存的 {step['save_data_to']} (缓存键 {cache_key[:12]})\n"
+                  f"Step {step['step_number']} finished. Execution time: {time.time() - start_time:.2f} seconds\n")
+            emit_event(on_event, "step_end", step=step['step_number'], elapsed=time.time() - start_time, cached=True, error=None)
+            return
+
+    result = runner.run_file(step_code_path, step_vars)
+    step_vars.update(result["updated_vars"])
+
+    lines = [f"Step {step['step_number']} output:"]
     if result["debug"]:
-        print(result["debug"])
+        lines.append(result["debug"])
     if result["output"]:
-        print(result["output"])
+        lines.append(result["output"])
     if result["error"]:
-        print(f"Error: {result['error']}")
-
-    global_vars.update(result["updated_vars"])
+        lines.append(f"Error: {result['error']}")
+    if len(lines) > 1:
+        emit_event(on_event, "step_output", step=step['step_number'], content="\n".join(lines[1:]))
 
     if "save_data_to" in step:
-        saved_data[step["save_data_to"]] = global_vars.get(step["save_data_to"])
+        data = step_vars.get(step["save_data_to"])
+        # plan.json 中声明 "dedup_news": true 的步骤，保存前先合并近似重复的新闻
+        if step.get("dedup_news") and data is not None:
+            data = step_vars["news_deduplicator"].dedup(data)
+            result["updated_vars"][step["save_data_to"]] = data
+        if cache_key and not result["error"] and data is not None:
+            step_cache.save(cache_key, step["save_data_to"], data)
+
+    with _vars_lock:
+        global_vars.update(result["updated_vars"])
+        if "save_data_to" in step:
+            saved_data[step["save_data_to"]] = global_vars.get(step["save_data_to"])
 
-    if step["type"] == "data_analysis":
-        analysis_result = global_vars.get("analysis_result", "")
-        step_result=f"步骤 {step['step_number']}: {step['description']} 的输出是：{analysis_result}"
-        analysis_results.append(step_result)
-        print(step_result)
+        if step["type"] == "data_analysis":
+            analysis_result = step_vars.get("analysis_result", "")
+            step_result=f"步骤 {step['step_number']}: {step['description']} 的输出是：{analysis_result}"
+            analysis_results[step['step_number']] = step_result
+            lines.append(step_result)
+            emit_event(on_event, "analysis_result", step=step['step_number'], content=step_result)
 
     end_time = time.time()
     elapsed_time = end_time - start_time
-    print(f"Step {step['step_number']} finished. Execution time: {elapsed_time:.2f} seconds\n")
+    lines.append(f"Step {step['step_number']} finished. Execution time: {elapsed_time:.2f} seconds\n")
+    print("\n".join(lines))
+    emit_event(on_event, "step_end", step=step['step_number'], elapsed=elapsed_time, cached=False, error=result["error"])
+
+def get_step_workers() -> int:
+    config = Config()
+    if config.has_key("max_step_workers"):
+        return int(config.get("max_step_workers"))
+    return 8
+
+def get_code_runner_backend() -> str:
+    config = Config()
+    return config.get("code_runner_backend").strip().lower() if config.has_key("code_runner_backend") else "ast"
+
+def create_code_runner(backend=None):
+    """
+    按 code_runner_backend 配置创建代码执行器，backend 不为空时忽略配置
+    ast: 在当前进程中执行(默认)
+    process: 在预热的工作进程中执行，步骤崩溃不会影响主进程
+    """
+    config = Config()
+    backend = backend or get_code_runner_backend()
+    if backend == "ast":
+        return ASTCodeRunner()
+    if backend != "process":
+        raise ValueError(f"不支持的 code_runner_backend: {backend}，可选值: ast, process")
+
+    from core.interpreter.process_code_runner import ProcessCodeRunner
+
+    def get_int(key, default):
+        return int(config.get(key)) if config.has_key(key) else default
+
+    return ProcessCodeRunner(
+        workers=get_int("code_runner_workers", 2),
+        timeout=get_int("code_runner_timeout", 600),
+        cpu_limit=get_int("code_runner_cpu_limit", 0),
+        memory_limit_mb=get_int("code_runner_memory_mb", 0),
+    )
 
 def create_report_prompt(initial_query: str, results_summary: str) -> str:
     return f"""
@@ -79,7 +174,74 @@ def create_report_prompt(initial_query: str, results_summary: str) -> str:
     报告应结构清晰、表述明确，并提供有意义的结论。
     """
 
-def run_content(n, cmd_args):
+def create_section_prompt(initial_query: str, step_result: str) -> str:
+    return f"""
+    基于以下初始查询和其中一个分析步骤的结果，写出最终报告中对应这一部分的内容：
+
+    初始查询：
+    {initial_query}
+
+    分析步骤的结果：
+    {step_result}
+
+    只总结这一步骤的主要发现和数据，不需要写开头和整体结论。
+    图片和文件按 ![分析图表]({{file_name}}) 格式保留。
+    """
+
+def stream_text(llm_client, message: str):
+    """流式调用 text_chat，逐段返回文本，客户端不支持流式输出时一次返回全部内容"""
+    response = llm_client.text_chat(message, is_stream=True)
+    if isinstance(response, str):
+        yield response
+        return
+    for chunk in response:
+        if chunk:
+            yield chunk
+
+def use_section_reports() -> bool:
+    config = Config()
+    return config.has_key("report_sections") and config.get("report_sections").strip().lower() in ("true", "1", "yes")
+
+class SectionReporter:
+    """
+    每个 data_analysis 步骤完成后立即在后台生成这一部分的报告，不用等到所有步骤结束
+    最终报告只需要把各部分整合起来，提示词更短，等待时间更少
+    """
+    def __init__(self, llm_factory, initial_query: str, max_workers: int = 4):
+        self.llm_factory = llm_factory
+        self.initial_query = initial_query
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="section-report")
+        self._futures = {}
+        self._step_results = {}
+
+    def submit(self, step_number: int, step_result: str):
+        self._step_results[step_number] = step_result
+        self._futures[step_number] = self._executor.submit(self._generate, step_result)
+
+    def _generate(self, step_result: str) -> str:
+        # 每个部分使用新的客户端，避免多个线程共用同一个对话历史
+        llm_client = self.llm_factory.get_instance()
+        return llm_client.text_chat(create_section_prompt(self.initial_query, step_result))
+
+    def results(self):
+        """按步骤顺序返回各部分报告，生成失败的部分使用原始的步骤结果"""
+        sections = {}
+        for step_number in sorted(self._futures):
+            try:
+                sections[step_number] = f"步骤 {step_number} 部分报告：\n{self._futures[step_number].result()}"
+            except Exception as e:
+                print(f"步骤 {step_number} 的部分报告生成失败: {e}")
+                sections[step_number] = self._step_results[step_number]
+        self._executor.shutdown(wait=False)
+        return sections
+
+def run_content(n, cmd_args, global_vars=None, runner=None, step_cache=None, on_event=None):
+    """
+    运行 agenda 中第 n 个计划，返回最终报告
+    常驻进程(比如定时任务)可以传入 load_shared_vars() 创建的 global_vars 和 runner/step_cache，避免每次运行重新创建
+    global_vars 会被复制一份，运行中产生的变量不会留到下一次运行，LLM 客户端每次运行重新创建
+    on_event 回调接收每个步骤的事件和最后的 report 事件
+    """
     with open('./json/agenda.json', 'r', encoding='utf-8') as agenda_file:
         agenda = json.load(agenda_file)
 
@@ -91,11 +253,14 @@ def run_content(n, cmd_args):
     with open(plan_path, 'r', encoding='utf-8') as plan_file:
         plan_data = json.load(plan_file)
 
-    global_vars = load_global_vars()
-    saved_data = {}
-    runner = ASTCodeRunner()
-    analysis_results = []
+    global_vars = load_run_vars(global_vars if global_vars is not None else load_shared_vars())
+    saved_data = StepDataStore()
+    runner = runner or create_code_runner()
+    step_cache = step_cache or StepCache()
+    analysis_results = {}
 
+    # 参数按步骤顺序累积，每个步骤能看到自己和之前步骤声明的参数
+    parameter_values = {}
     for step in plan_data["steps"]:
         step_code_path = os.path.join(os.path.dirname(plan_path), f'step_code_{step["step_number"]}.py')
         step["step_code_path"] = step_code_path
@@ -109,18 +274,45 @@ def run_content(n, cmd_args):
                     value = cmd_args[key]
                 else:
                     value = default_value
-                global_vars[key] = value
+                parameter_values[key] = value
                 print(f"Setting parameter {key} = {value}")
+        step["parameter_values"] = dict(parameter_values)
+
+    # report_sections = true 时，每个分析步骤完成后立即开始生成这一部分的报告
+    section_reporter = SectionReporter(global_vars['llm_factory'], plan_data["query_summary"]) if use_section_reports() else None
+    step_event = on_event
+    if section_reporter:
+        def step_event(event):
+            if event["type"] == "analysis_result":
+                section_reporter.submit(event["step"], event["content"])
+            if on_event:
+                on_event(event)
+
+    # 没有依赖关系的步骤并行执行，max_step_workers = 1 时按顺序执行
+    # 步骤通过 code_tools 保存的变量放在这次运行自己的命名空间中，运行结束后删除
+    scheduler = StepScheduler(plan_data["steps"], max_workers=get_step_workers())
+    with code_tools.namespace():
+        scheduler.run(lambda step: execute_step(step, global_vars, saved_data, runner, analysis_results, step_cache, step_event))
+    print(scheduler.report())
 
-        execute_step(step, global_vars, saved_data, runner, analysis_results)
+    if section_reporter:
+        analysis_results.update(section_reporter.results())
 
     llm_client = global_vars['llm_client']
-    combined_analysis_results = "\n".join(analysis_results)
+    combined_analysis_results = "\n".join(analysis_results[number] for number in sorted(analysis_results))
     report_message = create_report_prompt(plan_data["query_summary"], combined_analysis_results)
-    final_report = llm_client.text_chat(report_message)
 
+    # 报告按生成的顺序逐段输出，不用等待整个报告生成完
     print("Final Report:")
-    print(final_report)
+    chunks = []
+    for chunk in stream_text(llm_client, report_message):
+        print(chunk, end="", flush=True)
+        chunks.append(chunk)
+        emit_event(on_event, "report_chunk", content=chunk)
+    print()
+    final_report = "".join(chunks)
+    emit_event(on_event, "report", content=final_report)
+    return final_report
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -135,4 +327,5 @@ if __name__ == "__main__":
         key, value = arg.split('=')
         cmd_args[key] = value
     
+    configure_copy_on_write()
     run_content(n, cmd_args)
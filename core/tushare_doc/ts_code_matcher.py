@@ -1,37 +1,166 @@
+import hashlib
+import json
+import multiprocessing
 import pickle
 import re
 import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 import jieba
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from fuzzywuzzy import fuzz
 from rapidfuzz import fuzz as rfuzz
+from rapidfuzz import process as rprocess
+
+
+def _cut_chunk(texts):
+    return [jieba.lcut(text) for text in texts]
+
+
+def _parallel_cut(texts, workers=None, chunk_size=5000):
+    """
+    用 jieba 分词，数据量大时按块分给多个进程并行处理
+    进程池不可用时(比如受限环境)退回单进程
+    在子进程中(spawn 方式启动的工作进程会在导入时构建索引)不再启动进程池，避免嵌套的进程池
+    """
+    workers = workers or os.cpu_count() or 1
+    if multiprocessing.parent_process() is not None:
+        workers = 1
+    if workers <= 1 or len(texts) < chunk_size * 2:
+        return _cut_chunk(texts)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            return [tokens for result in executor.map(_cut_chunk, chunks) for tokens in result]
+    except (OSError, RuntimeError, BrokenProcessPool) as e:
+        print(f"Parallel tokenization failed, falling back to single process: {e}")
+        return _cut_chunk(texts)
+
+
+class CompactInvertedIndex:
+    """
+    紧凑的倒排索引: 每个词只保存行号(int32)，所有行号连续存放在一个数组里
+    缓存文件为 {path}.json(版本、源数据哈希、词表、偏移) 和 {path}.npy(行号，以内存映射方式加载)
+    源数据的哈希不一致时缓存自动失效
+    """
+    VERSION = 3
+
+    def __init__(self, tokens, offsets, postings, source_hash=""):
+        self.tokens = {token: i for i, token in enumerate(tokens)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.postings = postings
+        self.source_hash = source_hash
+
+    @classmethod
+    def build(cls, token_lists, source_hash=""):
+        # 展开成 (行号, 词) 对后用 factorize + unique 一次性生成倒排表，不逐个词追加列表
+        token_lists = list(token_lists)
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+        flat_tokens = [token for tokens in token_lists for token in tokens]
+        rows = np.repeat(np.arange(len(token_lists), dtype=np.int64), lengths)
+        codes, tokens = pd.factorize(pd.Series(flat_tokens, dtype=object), sort=False)
+        # 按 词编号 * 行数 + 行号 去重排序，结果先按词、再按行号有序
+        keys = np.sort(codes.astype(np.int64) * max(len(token_lists), 1) + rows)
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+        codes, rows = np.divmod(keys, max(len(token_lists), 1))
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(tokens)))
+        return cls(list(tokens), offsets, rows.astype(np.int32), source_hash)
+
+    def save(self, path):
+        """
+        两个文件先写到临时文件再用 os.replace 替换，先替换 .npy 再替换 .json
+        .json 中记录 .npy 的大小，并发构建或者中途退出留下不匹配的文件时 load 会重新构建
+        """
+        tokens = sorted(self.tokens, key=self.tokens.get)
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        npy_tmp, json_tmp = f"{path}.npy.{suffix}", f"{path}.json.{suffix}"
+        try:
+            with open(npy_tmp, 'wb') as f:
+                np.save(f, np.asarray(self.postings, dtype=np.int32))
+            with open(json_tmp, 'w', encoding='utf-8') as f:
+                json.dump({"version": self.VERSION, "source_hash": self.source_hash,
+                           "postings_bytes": os.path.getsize(npy_tmp),
+                           "tokens": tokens, "offsets": self.offsets.tolist()}, f, ensure_ascii=False)
+            os.replace(npy_tmp, f"{path}.npy")
+            os.replace(json_tmp, f"{path}.json")
+        finally:
+            for tmp in (npy_tmp, json_tmp):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    @classmethod
+    def load(cls, path, source_hash=""):
+        """缓存不存在、版本不一致或源数据已变化时返回 None"""
+        if not (os.path.exists(f"{path}.json") and os.path.exists(f"{path}.npy")):
+            return None
+        try:
+            with open(f"{path}.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("version") != cls.VERSION or meta.get("source_hash") != source_hash:
+                return None
+            if os.path.getsize(f"{path}.npy") != meta.get("postings_bytes"):
+                return None
+            postings = np.load(f"{path}.npy", mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if len(postings) != meta["offsets"][-1]:
+            return None
+        return cls(meta["tokens"], meta["offsets"], postings, source_hash)
+
+    def get(self, token, default=None):
+        i = self.tokens.get(token)
+        if i is None:
+            return default
+        return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+    def __contains__(self, token):
+        return token in self.tokens
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
 
 class StringMatcher:
-    def __init__(self, df, index_cache, index_column='content', result_column='ts_code'):
+    def __init__(self, df, index_cache, index_column='content', result_column='ts_code', exact_columns=None, cache_size=4096):
         self.df = df
         self.index_column = index_column
         self.result_column = result_column
+        self._choices = df[index_column].astype(str).tolist()
+        self._results = df[result_column].tolist()
+        # 兼容旧的 .pickle 缓存路径，新格式只使用去掉扩展名的部分
+        index_cache = index_cache[:-len('.pickle')] if index_cache.endswith('.pickle') else index_cache
+        self._source_hash = hashlib.sha1("\x00".join(self._choices).encode('utf-8')).hexdigest()
         self.inverted_index = self._build_inverted_index(index_cache)
+        if exact_columns is None:
+            exact_columns = [col for col in (result_column, 'name') if col in df.columns]
+        self._exact_index = self._build_exact_index(exact_columns)
+        self._ngram_index = self._build_ngram_index(index_cache)
+        self._cached_match = lru_cache(maxsize=cache_size)(self._rapidfuzz_match)
+
+    def _load_or_build(self, path, tokenize, name):
+        index = CompactInvertedIndex.load(path, self._source_hash)
+        if index is not None:
+            return index
+        print(f"Building {name} index...")
+        start_time = time.time()
+        index = CompactInvertedIndex.build(tokenize(self._choices), self._source_hash)
+        print(f"Built {name} index: {len(self._choices)} rows, {len(index)} tokens in {time.time() - start_time:.2f}s")
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Failed to save {name} index cache: {e}")
+        return index
 
     def _build_inverted_index(self, index_cache):
-        if os.path.exists(index_cache):
-            print("Loading inverted index from cache...")
-            with open(index_cache, 'rb') as f:
-                return pickle.load(f)
-        
-        print("Building inverted index...")
-        inverted_index = defaultdict(list)
-        for _, row in self.df.iterrows():
-            words = jieba.cut(row[self.index_column])
-            for word in words:
-                inverted_index[word].append(row.to_dict())
-        
-        print("Saving inverted index to cache...")
-        with open(index_cache, 'wb') as f:
-            pickle.dump(inverted_index, f)
-        
-        return inverted_index
+        return self._load_or_build(f"{index_cache}.words", _parallel_cut, "inverted")
 
     def exact_match(self, query):
         match = self.df[self.df[self.index_column].str.contains(query, case=False, na=False)]
@@ -46,28 +175,108 @@ class StringMatcher:
         best_match = max(self.df.itertuples(), key=lambda x: fuzz.partial_ratio(query, getattr(x, self.index_column)))
         return getattr(best_match, self.result_column) if fuzz.partial_ratio(query, getattr(best_match, self.index_column)) >= threshold else None
 
+    def _build_exact_index(self, exact_columns):
+        # 代码和名称的精确匹配，"601919.SH" 同时登记 "601919"
+        exact_index = {}
+        for column in exact_columns:
+            for row, value in enumerate(self.df[column].astype(str)):
+                key = value.strip().lower()
+                exact_index.setdefault(key, row)
+                if '.' in key:
+                    exact_index.setdefault(key.split('.')[0], row)
+        return exact_index
+
+    @staticmethod
+    def _ngrams(text, n=2):
+        text = text.lower()
+        if len(text) < n:
+            return {text} if text else set()
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def _build_ngram_index(self, index_cache):
+        return self._load_or_build(f"{index_cache}.ngram", lambda texts: [self._ngrams(text) for text in texts], "ngram")
+
+    def _get_candidates(self, query):
+        grams = self._ngrams(query)
+        if len(query) < 2:
+            # 单个字符时用包含该字符的二元组做候选
+            grams = {gram for gram in self._ngram_index if query.lower() in gram}
+        postings = [self._ngram_index.get(gram) for gram in grams if gram in self._ngram_index]
+        if not postings:
+            return []
+        return np.unique(np.concatenate(postings)).tolist()
+
+    def _rapidfuzz_match(self, query, threshold):
+        row = self._exact_index.get(query.strip().lower())
+        if row is not None:
+            return self._results[row]
+
+        candidates = self._get_candidates(query)
+        if candidates:
+            match = rprocess.extractOne(query, [self._choices[i] for i in candidates], scorer=rfuzz.partial_ratio, score_cutoff=threshold)
+            if match is not None:
+                return self._results[candidates[match[2]]]
+            return None
+        # 没有共同的二元组时退回全量匹配
+        match = rprocess.extractOne(query, self._choices, scorer=rfuzz.partial_ratio, score_cutoff=threshold)
+        return self._results[match[2]] if match is not None else None
+
     def rapidfuzz_match(self, query, threshold=80):
-        best_match = max(self.df.itertuples(), key=lambda x: rfuzz.partial_ratio(query, getattr(x, self.index_column)))
-        return getattr(best_match, self.result_column) if rfuzz.partial_ratio(query, getattr(best_match, self.index_column)) >= threshold else None
+        """
+        精确匹配代码/名称 -> 二元组倒排索引取候选 -> rapidfuzz 在候选中取最佳匹配，结果带 LRU 缓存
+        """
+        return self._cached_match(query, threshold)
+
+    def match_many(self, queries, threshold=80, chunk_size=256):
+        """
+        批量匹配，返回 DataFrame，列为 query、结果列、匹配到的内容、score
+        精确命中的直接返回，其余用 rapidfuzz.process.cdist 多线程一次性计算
+        低于 threshold 的结果为 None
+        """
+        queries = [str(query) for query in queries]
+        rows = [self._exact_index.get(query.strip().lower()) for query in queries]
+        scores = [100.0 if row is not None else 0.0 for row in rows]
+
+        pending = [i for i, row in enumerate(rows) if row is None]
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            matrix = rprocess.cdist([queries[i] for i in chunk], self._choices, scorer=rfuzz.partial_ratio, workers=-1)
+            best = np.argmax(matrix, axis=1)
+            for line, (i, column) in enumerate(zip(chunk, best)):
+                scores[i] = float(matrix[line, column])
+                if scores[i] >= threshold:
+                    rows[i] = int(column)
+
+        return pd.DataFrame({
+            'query': queries,
+            self.result_column: [self._results[row] if row is not None else None for row in rows],
+            self.index_column: [self._choices[row] if row is not None else None for row in rows],
+            'score': scores,
+        })
 
     def inverted_index_match(self, query):
         query_words = jieba.cut(query)
-        candidates = []
-        for word in query_words:
-            candidates.extend(self.inverted_index.get(word, []))
-        
-        if not candidates:
+        postings = [self.inverted_index.get(word) for word in query_words if word in self.inverted_index]
+        if not postings:
             return None
 
-        candidates_df = pd.DataFrame(candidates)
-        best_match = max(candidates_df.itertuples(), key=lambda x: fuzz.partial_ratio(query, getattr(x, self.index_column)))
-        return getattr(best_match, self.result_column)
+        candidates = np.unique(np.concatenate(postings))
+        best_row = max(candidates, key=lambda row: fuzz.partial_ratio(query, self._choices[row]))
+        return self._results[best_row]
 
 class TsCodeMatcher(StringMatcher):
     def __init__(self, index_column='content', result_column='ts_code'):
         df = pickle.load(open('./json/tushare_code_20240804.pickle', 'rb'))
-        index_cache = f"./json/tushare_code_20240804_index_{index_column}_{result_column}.pickle"
+        index_cache = f"./json/tushare_code_20240804_index_{index_column}_{result_column}"
         df['content'] = df['ts_code'] + ',' + df['name'] + ',' + df['type']
         super().__init__(df, index_cache, index_column, result_column)
     def __getitem__(self, query):
-        return self.rapidfuzz_match(query)
\ No newline at end of file
+        return self.rapidfuzz_match(query)
+
+
+def build_ts_code_index():
+    """生成 TsCodeMatcher 的索引缓存，由 build.py 调用，避免第一次导入时才构建"""
+    if not os.path.exists('./json/tushare_code_20240804.pickle'):
+        print("没有 ./json/tushare_code_20240804.pickle，跳过 TsCodeMatcher 索引")
+        return
+    TsCodeMatcher()
@@ -0,0 +1,90 @@
+"""
+工厂类的类名注册表
+
+LLMFactory、LLMCheapFactory、EmbeddingFactory、RankerFactory 通过扫描包中每个 .py 文件找到实现类。
+扫描结果保存在包的 __pycache__/class_registry.json 中，记录每个文件的修改时间和大小，
+下次启动时只 stat 文件，只有新增或修改过的文件才重新读取，注册表通常只是一次字典查找。
+python build.py 会重新生成所有注册表。
+"""
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+REGISTRY_FILE = "class_registry.json"
+_lock = threading.Lock()
+
+
+def _registry_path(package_dir: str) -> str:
+    return os.path.join(package_dir, "__pycache__", REGISTRY_FILE)
+
+
+def _load_registry(path: str) -> Dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_registry(path: str, registry: Dict):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(registry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        # 包目录只读时每次启动重新扫描
+        pass
+
+
+def discover_classes(package_dir: str, pattern: str, rebuild: bool = False) -> Dict[str, str]:
+    """
+    返回 {类名: 模块名}，类名是 pattern 第一个分组匹配到的内容，不扫描以 _ 开头的文件
+    :param rebuild: 忽略已有的注册表，重新扫描所有文件
+    """
+    path = _registry_path(package_dir)
+    key = pattern
+    with _lock:
+        registry = _load_registry(path)
+        cached = {} if rebuild else registry.get(key, {})
+        files: Dict[str, Dict] = {}
+        changed = rebuild or key not in registry
+        compiled: Optional[re.Pattern] = None
+        for entry in os.scandir(package_dir):
+            filename = entry.name
+            if not filename.endswith(".py") or filename.startswith("_") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            previous = cached.get(filename)
+            if previous and previous["mtime"] == stat.st_mtime_ns and previous["size"] == stat.st_size:
+                files[filename] = previous
+                continue
+            if compiled is None:
+                compiled = re.compile(pattern)
+            with open(entry.path, "r", encoding="utf-8") as file:
+                classes: List[str] = [match.group(1) for match in compiled.finditer(file.read())]
+            files[filename] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "classes": classes}
+            changed = True
+        if changed or files.keys() != cached.keys():
+            registry[key] = files
+            _save_registry(path, registry)
+
+    classes = {}
+    for filename in sorted(files):
+        for class_name in files[filename]["classes"]:
+            classes[class_name] = filename[:-3]
+    return classes
+
+
+def build_class_registries():
+    """重新生成所有工厂的注册表，由 build.py 调用"""
+    from ..llms.llm_factory import LLMFactory
+    from ..llms_cheap.llms_cheap_factory import LLMCheapFactory
+    from ..embeddings.embedding_factory import EmbeddingFactory
+    from ..embeddings.ranker_factory import RankerFactory
+    for factory_class in (LLMFactory, LLMCheapFactory, EmbeddingFactory, RankerFactory):
+        classes = factory_class.discover(rebuild=True)
+        print(f"{factory_class.__name__}: {len(classes)} 个实现类")
@@ -1,9 +1,83 @@
 # code_tools.py
 
+import atexit
+import os
+import re
+import shutil
+import sys
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterator as IteratorABC
+from contextlib import contextmanager
+from contextvars import ContextVar
 from threading import Lock
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
 from ..interpreter.data_summarizer import DataSummarizer
+from .config_setting import Config
+
+SUMMARY_SUFFIX = "_summary"
+DEFAULT_NAMESPACE = "default"
+
+# 当前线程/协程使用的命名空间，run_content 和 web UI 每次运行使用自己的命名空间
+_current_namespace: ContextVar[str] = ContextVar("code_tools_namespace", default=DEFAULT_NAMESPACE)
+
+
+class _Snapshot(NamedTuple):
+    data: Dict[str, Any]
+    lazy_summaries: Dict[str, str]      # <name>_summary -> name
+    versions: Dict[str, int]            # 变量名 -> 版本号，每次写入加一
+
+
+class _Spilled(NamedTuple):
+    """已经写到磁盘的 DataFrame，get_var 时重新读入"""
+    path: str
+    size: int
+
+
+class _Namespace:
+    def __init__(self, name: str, data: Dict[str, Any]):
+        self.name = name
+        self.snapshot = _Snapshot(data, {}, {})
+        self.summary_cache = {}      # name -> (版本号, 摘要)
+        self.summary_locks = {}      # name -> Lock，同一个变量的摘要只由一个线程计算
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['summary_locks'] = {}
+        return state
+
+
+def estimate_size(value: Any, sample_rows: int = 1000) -> int:
+    """估计变量占用的内存字节数，大表按前 sample_rows 行的实际大小按比例估计"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        rows = value if len(value) <= sample_rows else value.iloc[:sample_rows]
+        usage = rows.memory_usage(index=True, deep=True)
+        usage = int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+        return usage * len(value) // len(rows) if len(rows) else usage
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", name)
+
 
 class CodeTools:
+    """
+    add 保存非标量的值时不再立即计算摘要，只记录 <name>_summary 可以读取，
+    第一次读取时才计算，并按版本缓存，值被修改后重新计算
+
+    变量保存在不可变的快照中(写时复制): 写操作持有 _write_lock，复制字典、修改后整体替换快照；
+    读操作直接读取当前快照，不加锁。并行执行的步骤和 web UI 同时读取变量时不会互相等待。
+
+    变量按命名空间隔离，with code_tools.namespace(): 中的读写只作用于这次运行自己的命名空间，
+    新的命名空间从 add_with_recover 保存的变量开始，临时命名空间在 with 结束时删除。
+    setting.ini 中配置 code_tools_memory_mb 后，所有命名空间中 DataFrame 的总大小超过预算时，
+    最久没有读写的 DataFrame 保存为 parquet 并从内存中释放，get_var 时自动重新读入。
+    """
     _instance = None
     _lock = Lock()
 
@@ -11,94 +85,340 @@ class CodeTools:
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super(CodeTools, cls).__new__(cls)
-                cls._instance.data = {}
+                cls._instance._write_lock = Lock()
                 cls._instance.recovers = {}
                 cls._instance.summarizer = DataSummarizer()
+                cls._instance._namespaces = {DEFAULT_NAMESPACE: _Namespace(DEFAULT_NAMESPACE, {})}
+                cls._instance._lru = OrderedDict()      # (命名空间, 变量名) -> 内存中 DataFrame 的大小
+                cls._instance._lru_lock = Lock()
+                cls._instance.memory_used = 0
+                cls._instance._configure()
         return cls._instance
 
+    def _configure(self):
+        config = Config()
+        memory_mb = float(config.get("code_tools_memory_mb")) if config.has_key("code_tools_memory_mb") else 0
+        self.memory_budget = int(memory_mb * 1024 * 1024)      # 0 表示不限制
+        spill_dir = config.get("code_tools_spill_dir") if config.has_key("code_tools_spill_dir") else "./output/code_tools_spill"
+        # 每个进程使用自己的目录，进程退出时删除
+        self.spill_dir = os.path.join(spill_dir, str(os.getpid()))
+        atexit.register(shutil.rmtree, self.spill_dir, True)
+
+    # ---------- 命名空间 ----------
+
+    @contextmanager
+    def namespace(self, name: Optional[str] = None, drop: Optional[bool] = None) -> Iterator[str]:
+        """
+        在 with 块中(包括其中用 copy_context 启动的线程)使用命名空间 name
+        没有指定 name 时创建临时命名空间，drop 默认为 True，退出时删除其中的变量
+        """
+        if name is None:
+            name = f"run-{uuid.uuid4().hex[:12]}"
+            drop = True if drop is None else drop
+        token = _current_namespace.set(name)
+        try:
+            yield name
+        finally:
+            _current_namespace.reset(token)
+            if drop:
+                self.drop_namespace(name)
+
+    def current_namespace(self) -> str:
+        return _current_namespace.get()
+
+    def namespaces(self):
+        return list(self._namespaces)
+
+    def drop_namespace(self, name: str):
+        """删除命名空间中的所有变量和磁盘上的文件，默认命名空间恢复为 add_with_recover 保存的变量"""
+        with self._write_lock:
+            if name == DEFAULT_NAMESPACE:
+                self._namespaces[name] = _Namespace(name, dict(self.recovers))
+            else:
+                self._namespaces.pop(name, None)
+        self._forget(name)
+        shutil.rmtree(os.path.join(self.spill_dir, _safe_name(name)), ignore_errors=True)
+
+    def _ns(self) -> _Namespace:
+        name = _current_namespace.get()
+        ns = self._namespaces.get(name)
+        if ns is None:
+            with self._write_lock:
+                ns = self._namespaces.get(name)
+                if ns is None:
+                    ns = self._namespaces[name] = _Namespace(name, dict(self.recovers))
+        return ns
+
+    @property
+    def _snapshot(self) -> _Snapshot:
+        return self._ns().snapshot
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return self._snapshot.data
+
+    @property
+    def lazy_summaries(self) -> Dict[str, str]:
+        return self._snapshot.lazy_summaries
+
+    @property
+    def versions(self) -> Dict[str, int]:
+        return self._snapshot.versions
+
+    @staticmethod
+    def _copy(ns: _Namespace) -> _Snapshot:
+        # 调用方需要持有 self._write_lock
+        snapshot = ns.snapshot
+        return _Snapshot(dict(snapshot.data), dict(snapshot.lazy_summaries), dict(snapshot.versions))
+
+    def _touch(self, ns: _Namespace, snapshot: _Snapshot, name):
+        # 调用方需要持有 self._write_lock
+        snapshot.versions[name] = snapshot.versions.get(name, 0) + 1
+        ns.summary_cache.pop(name, None)
+        old = snapshot.data.get(name)
+        if isinstance(old, _Spilled):
+            self._remove_file(old.path)
+        self._untrack(ns.name, name)
+
+    # ---------- 内存预算 ----------
+
+    def _track(self, ns: _Namespace, name, value):
+        """记录内存中 DataFrame 的大小，超出预算时把最久没有使用的 DataFrame 写到磁盘"""
+        if not self.memory_budget or not isinstance(value, pd.DataFrame):
+            return
+        size = estimate_size(value)
+        with self._lru_lock:
+            self._lru[(ns.name, name)] = size
+            self.memory_used += size
+        self._evict(keep=(ns.name, name))
+
+    def _untrack(self, ns_name, name):
+        with self._lru_lock:
+            size = self._lru.pop((ns_name, name), None)
+            if size is not None:
+                self.memory_used -= size
+
+    def _forget(self, ns_name):
+        with self._lru_lock:
+            for key in [key for key in self._lru if key[0] == ns_name]:
+                self.memory_used -= self._lru.pop(key)
+
+    def _use(self, ns: _Namespace, name):
+        if not self.memory_budget:
+            return
+        with self._lru_lock:
+            if (ns.name, name) in self._lru:
+                self._lru.move_to_end((ns.name, name))
+
+    def _evict(self, keep: Optional[Tuple[str, str]] = None):
+        while True:
+            with self._lru_lock:
+                if self.memory_used <= self.memory_budget:
+                    return
+                victim = next((key for key in self._lru if key != keep), None)
+                if victim is None:
+                    return
+                size = self._lru.pop(victim)
+                self.memory_used -= size
+            ns_name, name = victim
+            ns = self._namespaces.get(ns_name)
+            if ns is None:
+                continue
+            value = ns.snapshot.data.get(name)
+            version = ns.snapshot.versions.get(name, 0)
+            if not isinstance(value, pd.DataFrame):
+                continue
+            # 写文件时不持有锁，写完后变量没有被修改才替换为磁盘上的版本
+            directory = os.path.join(self.spill_dir, _safe_name(ns_name))
+            path = os.path.join(directory, f"{_safe_name(name)}.{version}.parquet")
+            try:
+                os.makedirs(directory, exist_ok=True)
+                value.to_parquet(path)
+            except Exception as e:
+                # 列名不是字符串等不能保存为 parquet 的表留在内存中，不再计入预算
+                print(f"Variable '{name}' can not be spilled to disk: {type(e).__name__}: {str(e)}")
+                continue
+            with self._write_lock:
+                if self._namespaces.get(ns_name) is ns and ns.snapshot.data.get(name) is value \
+                        and ns.snapshot.versions.get(name, 0) == version:
+                    snapshot = self._copy(ns)
+                    snapshot.data[name] = _Spilled(path, size)
+                    ns.snapshot = snapshot
+                    path = None
+            if path:
+                self._remove_file(path)
+
+    def _load(self, ns: _Namespace, name, value):
+        """读取变量的值，已经写到磁盘的 DataFrame 重新读入内存"""
+        if not isinstance(value, _Spilled):
+            if isinstance(value, pd.DataFrame):
+                self._use(ns, name)
+            return value
+        try:
+            frame = pd.read_parquet(value.path)
+        except FileNotFoundError:
+            # 其他线程已经重新读入或者修改了这个变量
+            return self._load(ns, name, ns.snapshot.data.get(name))
+        with self._write_lock:
+            current = ns.snapshot.data.get(name)
+            if current is not value:
+                return frame if isinstance(current, _Spilled) else current
+            snapshot = self._copy(ns)
+            snapshot.data[name] = frame
+            ns.snapshot = snapshot
+        self._remove_file(value.path)
+        self._track(ns, name, frame)
+        return frame
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """每个命名空间中变量的大小(字节)和是否已经写到磁盘"""
+        result = {}
+        for ns_name, ns in list(self._namespaces.items()):
+            result[ns_name] = {
+                name: {"size": value.size if isinstance(value, _Spilled) else estimate_size(value),
+                       "spilled": isinstance(value, _Spilled)}
+                for name, value in ns.snapshot.data.items()
+            }
+        return result
+
+    # ---------- 变量读写 ----------
+
+    def _get_summary(self, ns: _Namespace, snapshot: _Snapshot, summary_name):
+        """计算 <name>_summary，只持有该变量自己的锁，缓存按版本号校验，不会读到旧的摘要"""
+        name = snapshot.lazy_summaries[summary_name]
+        version = snapshot.versions.get(name, 0)
+        cached = ns.summary_cache.get(name)
+        if cached and cached[0] == version:
+            return cached[1]
+        with ns.summary_locks.setdefault(name, Lock()):
+            cached = ns.summary_cache.get(name)
+            if cached and cached[0] == version:
+                return cached[1]
+            summary = self.summarizer.get_data_summary(self._load(ns, name, snapshot.data.get(name)))
+            if ns.snapshot.versions.get(name, 0) == version:
+                ns.summary_cache[name] = (version, summary)
+        return summary
+
+    def _set(self, ns: _Namespace, name, value) -> _Snapshot:
+        # 调用方需要持有 self._write_lock
+        snapshot = self._copy(ns)
+        self._touch(ns, snapshot, name)
+        snapshot.data[name] = value
+        return snapshot
+
     def add_with_recover(self, name, value):
-        with self._lock:
-            self.data[name] = value
+        ns = self._ns()
+        with self._write_lock:
+            ns.snapshot = self._set(ns, name, value)
             self.recovers[name] = value
+        self._track(ns, name, value)
 
     def add_var(self, name, value):
-        with self._lock:
-            if name not in self.data:
-                self.data[name] = value
-            else:
+        ns = self._ns()
+        with self._write_lock:
+            if name in ns.snapshot.data or name in ns.snapshot.lazy_summaries:
                 raise ValueError(f"Variable '{name}' already exists. Use set_var to modify it.")
+            ns.snapshot = self._set(ns, name, value)
+        self._track(ns, name, value)
 
     def set_var(self, name, value):
-        with self._lock:
-            self.data[name] = value
+        ns = self._ns()
+        with self._write_lock:
+            ns.snapshot = self._set(ns, name, value)
+        self._track(ns, name, value)
 
     def get_var(self, name):
-        with self._lock:
-            return self.data.get(name)
+        ns = self._ns()
+        snapshot = ns.snapshot
+        if name in snapshot.data or name not in snapshot.lazy_summaries:
+            return self._load(ns, name, snapshot.data.get(name))
+        return self._get_summary(ns, snapshot, name)
 
     def del_var(self, name):
-        with self._lock:
-            if name in self.data:
-                del self.data[name]
-                summary_name = f"{name}_summary"
-                if summary_name in self.data:
-                    del self.data[summary_name]
-            else:
+        ns = self._ns()
+        with self._write_lock:
+            if name not in ns.snapshot.data:
                 raise KeyError(f"Variable '{name}' does not exist.")
+            snapshot = self._copy(ns)
+            self._touch(ns, snapshot, name)
+            del snapshot.data[name]
+            summary_name = f"{name}{SUMMARY_SUFFIX}"
+            snapshot.lazy_summaries.pop(summary_name, None)
+            snapshot.data.pop(summary_name, None)
+            ns.snapshot = snapshot
 
     def clear(self):
-        with self._lock:
-            self.data.clear()
-            # Restore values from recovers
-            self.data.update(self.recovers)
+        """清空当前命名空间，恢复 add_with_recover 保存的变量"""
+        name = _current_namespace.get()
+        self.drop_namespace(name)
+        if name != DEFAULT_NAMESPACE:
+            self._ns()
 
     def add(self, name, value):
-        with self._lock:
-            if name not in self.data:
-                self.data[name] = value
-            else:
-                self.data[name] = value
+        ns = self._ns()
+        with self._write_lock:
+            if name in ns.snapshot.data:
                 print(f"Variable '{name}' already existed. Its value has been updated.")
-            
-            # Check if value is NOT one of the excluded types
-            if not isinstance(value, (str, int, float, bool, complex)):
-                summary = self.summarizer.get_data_summary(value)
-                self.data[f"{name}_summary"] = summary
+            snapshot = self._set(ns, name, value)
+
+            # 非标量的值可以读取 <name>_summary，摘要在第一次读取时才计算
+            # 迭代器(比如分块读取的 TextFileReader)计算摘要会消耗数据，不提供摘要
+            summary_name = f"{name}{SUMMARY_SUFFIX}"
+            snapshot.data.pop(summary_name, None)
+            if not isinstance(value, (str, int, float, bool, complex, IteratorABC)):
+                snapshot.lazy_summaries[summary_name] = name
+            else:
+                snapshot.lazy_summaries.pop(summary_name, None)
+            ns.snapshot = snapshot
+        self._track(ns, name, value)
 
     def is_exists(self, name):
-        with self._lock:
-            return name in self.data
+        snapshot = self._snapshot
+        return name in snapshot.data or name in snapshot.lazy_summaries
 
     def __contains__(self, name):
         return self.is_exists(name)
 
     def __iter__(self):
-        with self._lock:
-            return iter(self.data)
+        snapshot = self._snapshot
+        return iter(list(snapshot.data) + [name for name in snapshot.lazy_summaries if name not in snapshot.data])
 
     def __getitem__(self, name):
-        with self._lock:
-            if name in self.data:
-                return self.data[name]
-            else:
-                raise KeyError(f"Variable '{name}' does not exist.")
+        ns = self._ns()
+        snapshot = ns.snapshot
+        if name in snapshot.data:
+            return self._load(ns, name, snapshot.data[name])
+        if name not in snapshot.lazy_summaries:
+            raise KeyError(f"Variable '{name}' does not exist.")
+        return self._get_summary(ns, snapshot, name)
 
     def __setitem__(self, name, value):
-        if name in self.data:
+        if name in self._snapshot.data:
             self.set_var(name, value)
         else:
             self.add_var(name, value)
 
     def __len__(self):
-        with self._lock:
-            return len(self.data)
+        snapshot = self._snapshot
+        return len(snapshot.data) + sum(1 for name in snapshot.lazy_summaries if name not in snapshot.data)
 
     def __getstate__(self):
         state = self.__dict__.copy()
-        del state['_lock']  # 不序列化 _lock
+        # 不序列化锁
+        del state['_write_lock']
+        del state['_lru_lock']
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
-        self._lock = Lock()  # 反序列化时重新创建 _lock
-code_tools = CodeTools()
\ No newline at end of file
+        # 反序列化时重新创建锁
+        self._write_lock = Lock()
+        self._lru_lock = Lock()
+code_tools = CodeTools()
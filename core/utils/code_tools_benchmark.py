@@ -0,0 +1,104 @@
+"""
+CodeTools 多线程读写的微基准
+
+    python -m core.utils.code_tools_benchmark                  # 默认 1/2/4/8/16/32 个线程
+    python -m core.utils.code_tools_benchmark --threads 8 64 --write-ratio 0.05
+
+每个线程按 write_ratio 的比例混合执行 get_var / in / 读取摘要 和 set_var，
+输出每秒的操作数，并和所有操作共用一个全局锁的实现对比。
+"""
+import argparse
+import threading
+import time
+from typing import Callable, List, Tuple
+import numpy as np
+import pandas as pd
+from .code_tools import CodeTools
+
+
+class LockedStore:
+    """所有读写都持有同一个锁，作为对比的基准"""
+
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def set_var(self, name, value):
+        with self._lock:
+            self.data[name] = value
+
+    def get_var(self, name):
+        with self._lock:
+            return self.data.get(name)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self.data
+
+
+def run_threads(store, threads: int, ops_per_thread: int, write_ratio: float, keys: List[str]) -> float:
+    barrier = threading.Barrier(threads + 1)
+    write_every = int(1 / write_ratio) if write_ratio > 0 else 0
+
+    def worker(seed: int):
+        barrier.wait()
+        for i in range(ops_per_thread):
+            key = keys[(seed + i) % len(keys)]
+            if write_every and i % write_every == 0:
+                store.set_var(key, i)
+            elif i % 2:
+                store.get_var(key)
+            else:
+                key in store
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return threads * ops_per_thread / (time.perf_counter() - start)
+
+
+def measure_summary_reads(store: CodeTools, threads: int) -> float:
+    """多个线程同时读取大表的摘要，摘要只计算一次，计算期间其他变量的读写不受影响"""
+    store.add("benchmark_frame", pd.DataFrame(np.random.default_rng(0).normal(size=(500_000, 4))))
+    readers = [threading.Thread(target=store.get_var, args=("benchmark_frame_summary",)) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in readers:
+        thread.start()
+    for thread in readers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    store.del_var("benchmark_frame")
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CodeTools 多线程读写微基准")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--ops", type=int, default=50_000, help="每个线程的操作数")
+    parser.add_argument("--write-ratio", type=float, default=0.01)
+    parser.add_argument("--keys", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    keys = [f"benchmark_var_{n}" for n in range(args.keys)]
+    code_tools = CodeTools()
+    stores: List[Tuple[str, Callable[[], object]]] = [("CodeTools", lambda: code_tools), ("全局锁", LockedStore)]
+    print(f"{'线程数':>6} " + " ".join(f"{name:>14}" for name, _ in stores) + "  (次/秒)")
+    for threads in args.threads:
+        results = []
+        for _, factory in stores:
+            store = factory()
+            for key in keys:
+                store.set_var(key, 0)
+            results.append(run_threads(store, threads, args.ops, args.write_ratio, keys))
+        print(f"{threads:>6} " + " ".join(f"{ops:>14,.0f}" for ops in results))
+    for key in keys:
+        code_tools.del_var(key)
+    print(f"{max(args.threads)} 个线程同时读取大表摘要耗时: {measure_summary_reads(code_tools, max(args.threads)):.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,9 +30,10 @@ class CodeToolsRequired(metaclass=Singleton):
 
     def add_required(self):
         default_vars = self.default_vars
+        # 保存为可恢复的变量，每次运行新建的命名空间中都有这些工具
         for name, value in default_vars.items():
             if not self._tools.is_exists(name):
-                self._tools.add_var(name, value)
+                self._tools.add_with_recover(name, value)
 
     def is_required(self):
         return self.required
@@ -0,0 +1,228 @@
+"""
+新闻去重和聚类
+
+多个新闻源(财联社、东方财富、新浪、同花顺、富途、个股新闻)的内容大量重叠，
+在交给LLM总结之前先把近似重复的新闻合并，可以明显缩短后续的提示词。
+
+两级判断:
+1. SimHash 预筛选: 字符 2-gram 的 64 位 SimHash，海明距离很小的新闻直接判为重复，不需要计算向量
+2. 向量相似度: 剩下的新闻用 EmbeddingFactory 计算向量，和已有聚类的代表新闻比较余弦相似度
+
+NewsClusterIndex 是增量的，同一个进程内多次调用(比如定时任务)会记住之前见过的新闻。
+最多保留 max_clusters 个聚类，超出后删除最早的聚类，常驻进程的内存和比较次数不会一直增长。
+"""
+import hashlib
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+DEFAULT_TEXT_COLUMNS = ['标题', '摘要', '内容']
+
+
+def simhash(text: str, ngram: int = 2) -> int:
+    weights = [0] * 64
+    text = "".join(text.split())
+    grams = [text[i:i + ngram] for i in range(max(len(text) - ngram + 1, 1))]
+    for gram in grams:
+        value = int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    result = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            result |= 1 << bit
+    return result
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NewsClusterIndex:
+    """
+    增量聚类索引
+    :param embedding_name: EmbeddingFactory 中的类名，为空时使用配置的 embedding_api
+    :param cosine_threshold: 向量余弦相似度达到该值视为重复
+    :param hamming_threshold: SimHash 海明距离不超过该值直接视为重复，最大为 7
+    :param use_embedding: 为 False 时只使用 SimHash
+    :param max_clusters: 保留的聚类数量上限，超出后删除最早建立的聚类
+    """
+    BANDS = 8
+
+    def __init__(self, embedding_name: str = "", cosine_threshold: float = 0.92,
+                 hamming_threshold: int = 6, use_embedding: bool = True, max_clusters: int = 10000):
+        self.embedding_name = embedding_name
+        self.cosine_threshold = cosine_threshold
+        self.hamming_threshold = hamming_threshold
+        self.use_embedding = use_embedding
+        self.max_clusters = max_clusters
+        self._embedding = None
+        self._lock = threading.Lock()
+        self._hashes: "OrderedDict[int, int]" = OrderedDict()   # 聚类id -> 代表新闻的 SimHash，按建立顺序
+        self._bands: Dict[tuple, List[int]] = defaultdict(list)
+        # 聚类 id 对应 _vectors 的第 id % max_clusters 行，容量翻倍增长到 max_clusters 后循环使用
+        # 没有向量的聚类对应全 0 的行，相似度为 0 不会匹配
+        self._vectors: Optional[np.ndarray] = None
+        self.next_id = 0
+        self.sizes: Dict[int, int] = {}
+
+    @property
+    def embedding(self):
+        if self._embedding is None:
+            from ..embeddings.embedding_factory import EmbeddingFactory
+            self._embedding = EmbeddingFactory().get_instance(self.embedding_name)
+        return self._embedding
+
+    def _band_keys(self, value: int):
+        width = 64 // self.BANDS
+        mask = (1 << width) - 1
+        return [(i, value >> (i * width) & mask) for i in range(self.BANDS)]
+
+    def _find_by_simhash(self, value: int) -> Optional[int]:
+        # 海明距离 < 8 时 8 个分段中至少有一段完全相同，只需要比较同段的候选
+        for key in self._band_keys(value):
+            for cluster_id in self._bands.get(key, []):
+                if hamming_distance(value, self._hashes[cluster_id]) <= self.hamming_threshold:
+                    return cluster_id
+        return None
+
+    def _evict_oldest(self):
+        cluster_id, value = self._hashes.popitem(last=False)
+        self.sizes.pop(cluster_id, None)
+        for key in self._band_keys(value):
+            members = self._bands[key]
+            members.remove(cluster_id)
+            if not members:
+                del self._bands[key]
+
+    def _new_cluster(self, value: int, vector: Optional[np.ndarray]) -> int:
+        while len(self._hashes) >= self.max_clusters:
+            self._evict_oldest()
+        cluster_id = self.next_id
+        self.next_id += 1
+        self._hashes[cluster_id] = value
+        self.sizes[cluster_id] = 0
+        for key in self._band_keys(value):
+            self._bands[key].append(cluster_id)
+        if vector is not None:
+            self._store_vector(cluster_id, vector)
+        elif self._vectors is not None and cluster_id % self.max_clusters < len(self._vectors):
+            self._vectors[cluster_id % self.max_clusters] = 0
+        return cluster_id
+
+    def _store_vector(self, cluster_id: int, vector: np.ndarray):
+        row = cluster_id % self.max_clusters
+        if self._vectors is None:
+            self._vectors = np.zeros((min(64, self.max_clusters), vector.shape[0]), dtype=np.float32)
+        if row >= len(self._vectors):
+            capacity = min(max(len(self._vectors) * 2, row + 1), self.max_clusters)
+            grown = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+            grown[:len(self._vectors)] = self._vectors
+            self._vectors = grown
+        self._vectors[row] = vector
+
+    def _find_by_vector(self, vector: np.ndarray) -> Optional[int]:
+        if self._vectors is None:
+            return None
+        rows = min(self.next_id, len(self._vectors))
+        scores = self._vectors[:rows] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.cosine_threshold:
+            return None
+        # 第 best 行属于仍在索引中的最新聚类
+        cluster_id = (self.next_id - 1) - ((self.next_id - 1 - best) % self.max_clusters)
+        return cluster_id if cluster_id in self._hashes else None
+
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        if not self.use_embedding or not texts:
+            return None
+        try:
+            vectors = np.asarray(self.embedding.convert_to_embedding(texts), dtype=np.float32)
+        except Exception as e:
+            print(f"计算新闻向量失败，只使用 SimHash 去重: {e}")
+            self.use_embedding = False
+            return None
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, texts: Sequence[str]) -> List[int]:
+        """
+        把新闻加入索引，返回每条新闻所属的聚类id
+        """
+        with self._lock:
+            cluster_ids: List[Optional[int]] = []
+            hashes = [simhash(text) for text in texts]
+            pending = []
+            for i, value in enumerate(hashes):
+                cluster_id = self._find_by_simhash(value)
+                cluster_ids.append(cluster_id)
+                if cluster_id is None:
+                    pending.append(i)
+
+            vectors = self._embed([texts[i] for i in pending])
+            for row, i in enumerate(pending):
+                # 同一批里前面的新闻可能已经建立了相同内容的聚类
+                cluster_id = self._find_by_simhash(hashes[i])
+                if cluster_id is None and vectors is not None:
+                    cluster_id = self._find_by_vector(vectors[row])
+                if cluster_id is None:
+                    cluster_id = self._new_cluster(hashes[i], vectors[row] if vectors is not None else None)
+                cluster_ids[i] = cluster_id
+
+            for cluster_id in cluster_ids:
+                # 一批新闻超过 max_clusters 时前面的聚类可能已经被删除
+                if cluster_id in self.sizes:
+                    self.sizes[cluster_id] += 1
+            return cluster_ids
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+class NewsDeduplicator:
+    """
+    对新闻 DataFrame 去重，每个聚类只保留第一条新闻，并增加 重复数量 列
+    用法:
+        news_deduplicator.dedup(cls_telegraph_news)
+        news_deduplicator.dedup_many([df_cls, df_em, df_sina])
+    """
+    def __init__(self, embedding_name: str = "", cosine_threshold: float = 0.92,
+                 hamming_threshold: int = 6, use_embedding: bool = True, max_clusters: int = 10000):
+        self.index = NewsClusterIndex(embedding_name, cosine_threshold, hamming_threshold, use_embedding, max_clusters)
+
+    @staticmethod
+    def get_texts(df: pd.DataFrame, text_columns: Optional[List[str]] = None) -> List[str]:
+        columns = text_columns or [col for col in DEFAULT_TEXT_COLUMNS if col in df.columns]
+        if not columns:
+            columns = [col for col in df.columns if df[col].dtype == object]
+        return df[columns].fillna("").astype(str).agg("\n".join, axis=1).tolist()
+
+    def dedup(self, df: pd.DataFrame, text_columns: Optional[List[str]] = None, keep_seen: bool = True) -> pd.DataFrame:
+        """
+        :param df: 新闻 DataFrame
+        :param text_columns: 用于比较的列，默认使用 标题/摘要/内容 中存在的列
+        :param keep_seen: 为 False 时，之前调用中已经出现过的新闻也会被去掉，适合定时任务只看新增新闻
+        重复数量 只统计本次传入的新闻，不包括之前调用中见过的新闻
+        """
+        if df is None or df.empty:
+            return df
+        before = self.index.next_id
+        cluster_ids = self.index.add(self.get_texts(df, text_columns))
+        counts = Counter(cluster_ids)
+        first_rows = {}
+        for row, cluster_id in enumerate(cluster_ids):
+            if cluster_id not in first_rows and (keep_seen or cluster_id >= before):
+                first_rows[cluster_id] = row
+        result = df.iloc[sorted(first_rows.values())].copy()
+        result['重复数量'] = [counts[cluster_ids[row]] for row in sorted(first_rows.values())]
+        print(f"新闻去重: {len(df)} 条 -> {len(result)} 条")
+        return result
+
+    def dedup_many(self, frames: List[pd.DataFrame], text_columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """把多个新闻源合并后去重，增加 来源 列记录新闻来自第几个数据源"""
+        frames = [df.assign(来源=i) for i, df in enumerate(frames) if df is not None and not df.empty]
+        if not frames:
+            return pd.DataFrame()
+        return self.dedup(pd.concat(frames, ignore_index=True), text_columns)
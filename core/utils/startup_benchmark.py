@@ -0,0 +1,183 @@
+"""
+启动耗时基准
+
+每个入口模块在新的 python -X importtime 进程中导入，记录:
+    import_time   导入入口模块的总耗时(秒)
+    rss_mb        导入后进程的最大常驻内存(MB)
+    modules       导入耗时最多的包 (-X importtime 中包内各模块自身耗时之和，秒)
+    first_step    --first-step N 时从进程启动到计划 N 的第一个步骤开始的耗时(秒)，包括创建 LLM 客户端等
+
+用法:
+    python -m core.utils.startup_benchmark                                  # 输出结果
+    python -m core.utils.startup_benchmark --save output/startup_baseline.json
+    python -m core.utils.startup_benchmark --check output/startup_baseline.json --threshold 0.2
+--check 时任何入口的耗时或内存比基准增加超过 threshold(并且超过 min_delta)就返回 1，可以放在 CI 中。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+DEFAULT_MODULES = ["core.run_content", "core.webui", "core.plan_scheduler", "core.api_server", "dealer.futures_provider"]
+MARKER = "startup-benchmark-begin"
+
+_IMPORT_CHILD = f"""
+import json, sys, time
+sys.stderr.write("{MARKER}\\n")
+start = time.perf_counter()
+import importlib
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    rss_mb = rss / 1024 if sys.platform == "darwin" else rss
+except ImportError:
+    rss_mb = None
+print(json.dumps({{"import_time": elapsed, "rss_mb": rss_mb}}))
+"""
+
+_FIRST_STEP_CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+from core.run_content import run_content
+
+def on_event(event):
+    if event["type"] == "step_start":
+        print(json.dumps({"first_step": time.perf_counter() - start}), flush=True)
+        os._exit(0)
+
+run_content(int(sys.argv[1]), {}, on_event=on_event)
+"""
+
+
+def parse_importtime(stderr: str, top: int = 15) -> Dict[str, float]:
+    """解析 -X importtime 的输出，按顶层包汇总各模块自身的导入耗时，返回耗时最多的包 {包名: 秒}"""
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    packages: Dict[str, float] = {}
+    for line in lines:
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        if not self_time.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_time) / 1e6
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top])
+
+
+def _run_child(args: List[str], importtime: bool) -> Dict[str, Any]:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + args
+    process = subprocess.run(command, capture_output=True, text=True, encoding="utf-8", errors="replace")
+    output = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not output:
+        error = (process.stderr.strip().splitlines() or ["no output"])[-1]
+        return {"error": error}
+    result = json.loads(output[-1])
+    if importtime:
+        result["modules"] = parse_importtime(process.stderr)
+    return result
+
+
+def measure_module(module: str, repeat: int = 3) -> Dict[str, Any]:
+    runs = [_run_child(["-c", _IMPORT_CHILD, module], importtime=True) for _ in range(repeat)]
+    errors = [run["error"] for run in runs if "error" in run]
+    if errors:
+        return {"error": errors[0]}
+    rss = [run["rss_mb"] for run in runs if run["rss_mb"] is not None]
+    # 各模块的耗时取最后一次运行，总耗时和内存取中位数
+    return {
+        "import_time": statistics.median(run["import_time"] for run in runs),
+        "rss_mb": statistics.median(rss) if rss else None,
+        "modules": runs[-1]["modules"],
+    }
+
+
+def measure_first_step(index: int, repeat: int = 1) -> Dict[str, Any]:
+    runs = [_run_child(["-c", _FIRST_STEP_CHILD, str(index)], importtime=False) for _ in range(repeat)]
+    errors = [run["error"] for run in runs if "error" in run]
+    if errors:
+        return {"error": errors[0]}
+    return {"first_step": statistics.median(run["first_step"] for run in runs)}
+
+
+def run_benchmark(modules: List[str], repeat: int = 3, first_step: Optional[int] = None) -> Dict[str, Any]:
+    results = {"python": sys.version.split()[0], "platform": sys.platform, "entries": {}}
+    for module in modules:
+        results["entries"][module] = measure_module(module, repeat)
+    if first_step is not None:
+        results["entries"][f"first_step:{first_step}"] = measure_first_step(first_step)
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2,
+            min_delta: Optional[Dict[str, float]] = None) -> List[str]:
+    """返回超出阈值的退化项，min_delta 是每个指标忽略的最小绝对变化"""
+    min_delta = min_delta or {"import_time": 0.05, "first_step": 0.2, "rss_mb": 20}
+    regressions = []
+    for entry, base in baseline.get("entries", {}).items():
+        now = current["entries"].get(entry)
+        if not now or "error" in base:
+            continue
+        if "error" in now:
+            regressions.append(f"{entry}: {now['error']}")
+            continue
+        for metric, floor in min_delta.items():
+            if base.get(metric) is None or now.get(metric) is None:
+                continue
+            if now[metric] > base[metric] * (1 + threshold) and now[metric] - base[metric] > floor:
+                regressions.append(f"{entry} {metric}: {base[metric]:.3f} -> {now[metric]:.3f}")
+    return regressions
+
+
+def print_results(results: Dict[str, Any], top: int = 5):
+    for entry, result in results["entries"].items():
+        if "error" in result:
+            print(f"{entry}: 失败 {result['error']}")
+            continue
+        if "first_step" in result:
+            print(f"{entry}: 第一个步骤开始 {result['first_step']:.2f} 秒")
+            continue
+        rss = f"{result['rss_mb']:.0f} MB" if result["rss_mb"] is not None else "未知"
+        print(f"{entry}: 导入 {result['import_time']:.2f} 秒, 内存 {rss}")
+        for name, seconds in list(result["modules"].items())[:top]:
+            print(f"    {name:<40} {seconds:.3f} 秒")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--first-step", type=int, default=None, help="测量运行 agenda 中第 N 个计划到第一个步骤开始的耗时")
+    parser.add_argument("--save", help="把结果保存为基准 JSON")
+    parser.add_argument("--check", help="和基准 JSON 比较，退化超过阈值时返回 1")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许增加的比例")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.modules, args.repeat, args.first_step)
+    print_results(results)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"基准已保存到 {args.save}")
+    if args.check:
+        with open(args.check, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("启动耗时退化:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("没有超过阈值的退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,11 +3,23 @@ import os
 import json
 import time
 import re
+import shutil
+import uuid
 from datetime import datetime
 from core.llms.llm_factory import LLMFactory
 from core.interpreter.ast_code_runner import ASTCodeRunner
 from core.interpreter.data_summarizer import DataSummarizer
+from core.interpreter.step_data_store import StepDataStore, configure_copy_on_write
+from core.utils.news_dedup import NewsDeduplicator
 from core.utils.code_tools_required import add_required_tools
+from core.utils.code_tools import code_tools
+from core.utils.config_setting import Config
+from core.run_content import stream_text
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+OUTPUT_DIR = './output'
+RUN_IMAGE_DIR = './output/webui_runs'
+MARKDOWN_IMAGE_PATTERN = re.compile(r'!\[(.*?)\]\((.*?)\)')
 
 def load_global_vars():
     llm_factory = LLMFactory()
@@ -16,16 +28,76 @@ def load_global_vars():
     return {
         'llm_client': llm_client,
         'llm_factory': llm_factory,
-        'data_summarizer': data_summarizer
+        'data_summarizer': data_summarizer,
+        'news_deduplicator': NewsDeduplicator()
     }
 
-def execute_step(step, global_vars, saved_data, runner, analysis_results):
+class RunLog:
+    """
+    记录一次运行中显示的内容，显示的同时保存下来，使用缓存的结果时按原来的顺序重新显示
+    """
+    def __init__(self):
+        self.items = []
+
+    def write(self, content):
+        st.write(content)
+        self.items.append(("write", content))
+
+    def error(self, content):
+        st.error(content)
+        self.items.append(("error", content))
+
+    def replay(self):
+        for kind, content in self.items:
+            if kind == "error":
+                st.error(content)
+            else:
+                st.write(content)
+
+    @property
+    def has_errors(self):
+        return any(kind == "error" for kind, _ in self.items)
+
+@st.cache_resource
+def get_result_cache():
+    # 所有会话共享的运行结果缓存，{(index, 参数): 运行结果}
+    return {}
+
+def get_cache_ttl() -> int:
+    config = Config()
+    return int(config.get("webui_cache_ttl")) if config.has_key("webui_cache_ttl") else 600
+
+def evict_expired_results(cache, ttl):
+    now = time.time()
+    for key, entry in list(cache.items()):
+        if now - entry["time"] > ttl:
+            cache.pop(key, None)
+            remove_run_images(entry["run_id"])
+
+def get_cached_result(cache_key):
+    cache = get_result_cache()
+    evict_expired_results(cache, get_cache_ttl())
+    return cache.get(cache_key)
+
+def store_result(cache_key, entry):
+    # 有步骤出错的运行(比如获取数据时网络中断)不缓存，下次重新运行
+    cache = get_result_cache()
+    evict_expired_results(cache, get_cache_ttl())
+    if entry["log"].has_errors:
+        return False
+    previous = cache.get(cache_key)
+    cache[cache_key] = entry
+    if previous:
+        remove_run_images(previous["run_id"])
+    return True
+
+def execute_step(step, global_vars, saved_data, runner, analysis_results, log):
     step_code_path = step["step_code_path"]
     if not os.path.exists(step_code_path):
         raise FileNotFoundError(f"{step_code_path} not found")
 
-    st.write(f"执行步骤 {step['step_number']}: {step['description']}")
-    st.write(f"运行代码来自: {step_code_path}")
+    log.write(f"执行步骤 {step['step_number']}: {step['description']}")
+    log.write(f"运行代码来自: {step_code_path}")
 
     start_time = time.time()
     
@@ -38,36 +110,40 @@ def execute_step(step, global_vars, saved_data, runner, analysis_results):
         for required_data in step.get("required_data", []):
             global_vars[required_data] = saved_data.get(required_data)
 
-    result = runner.run(code, global_vars)
+    result = runner.run_file(step_code_path, global_vars)
     
     if result["debug"]:
-        st.write(result["debug"])
+        log.write(result["debug"])
     if result["output"]:
-        st.write(result["output"])
+        log.write(result["output"])
     if result["error"]:
-        st.error(f"错误: {result['error']}")
+        log.error(f"错误: {result['error']}")
 
     global_vars.update(result["updated_vars"])
 
     if not has_code_tools:
         if "save_data_to" in step:
-            saved_data[step["save_data_to"]] = global_vars.get(step["save_data_to"])
+            data = global_vars.get(step["save_data_to"])
+            if step.get("dedup_news") and data is not None:
+                data = global_vars["news_deduplicator"].dedup(data)
+                global_vars[step["save_data_to"]] = data
+            saved_data[step["save_data_to"]] = data
 
         if step["type"] == "data_analysis":
             analysis_result = global_vars.get("analysis_result", "")
             step_result = f"步骤 {step['step_number']}: {step['description']} 的输出是：{analysis_result}"
             analysis_results.append(step_result)
-            st.write(step_result)
+            log.write(step_result)
 
         end_time = time.time()
         elapsed_time = end_time - start_time
-        st.write(f"步骤 {step['step_number']} 完成。执行时间: {elapsed_time:.2f} 秒\n")
+        log.write(f"步骤 {step['step_number']} 完成。执行时间: {elapsed_time:.2f} 秒\n")
     else:
         step_number = step["step_number"]
         analysis_result = add_required_tools.tools[f"analysis_result_{step_number}"]
         step_result = f"步骤 {step['step_number']}: {step['description']} 的输出是：{analysis_result}"
         analysis_results.append(step_result)
-        st.write(step_result)
+        log.write(step_result)
 
 def create_report_prompt(initial_query: str, results_summary: str) -> str:
     return f"""
@@ -90,37 +166,55 @@ def create_report_prompt(initial_query: str, results_summary: str) -> str:
     报告应结构清晰、表述明确，并提供有意义的结论。
     """
 
-def get_unique_images(output_dir):
-    if os.path.exists(output_dir):
-        return list(set([f for f in os.listdir(output_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]))
-    return []
+def snapshot_images(output_dir=OUTPUT_DIR):
+    """返回 ./output 中图片的 {文件名: 修改时间}"""
+    if not os.path.isdir(output_dir):
+        return {}
+    return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(output_dir)
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)}
 
-def display_report_with_images(report, output_dir):
-    unique_images = get_unique_images(output_dir)
+def collect_run_images(before, run_id, output_dir=OUTPUT_DIR):
+    """
+    把运行期间新建或修改的图片复制到 ./output/webui_runs/<run_id>，返回 {文件名: 复制后的路径}
+    之后的运行覆盖 ./output 中的同名文件，也不会影响缓存的结果
+    """
+    images = {}
+    run_dir = os.path.join(RUN_IMAGE_DIR, run_id)
+    for name, mtime in snapshot_images(output_dir).items():
+        if before.get(name) == mtime:
+            continue
+        os.makedirs(run_dir, exist_ok=True)
+        path = os.path.join(run_dir, name)
+        shutil.copy2(os.path.join(output_dir, name), path)
+        images[name] = path
+    return images
+
+def remove_run_images(run_id):
+    shutil.rmtree(os.path.join(RUN_IMAGE_DIR, run_id), ignore_errors=True)
+
+def display_report_with_images(report, images):
     displayed_images = set()
-    
-    # 将报告拆分成段落
-    paragraphs = report.split('\n\n')
-    
-    for paragraph in paragraphs:
-        # 检查段落中的图片引用
-        for img in unique_images:
-            img_pattern = r'!\[.*?\]\({}\)'.format(re.escape(img))
-            if re.search(img_pattern, paragraph) and img not in displayed_images:
-                st.image(os.path.join(output_dir, img), caption=img)
-                displayed_images.add(img)
-                paragraph = re.sub(img_pattern, '', paragraph)
-        
-        # 显示处理后的段落文本
+
+    def show_image(match):
+        path = images.get(os.path.basename(match.group(2)))
+        if not path:
+            return match.group(0)
+        if path not in displayed_images:
+            st.image(path, caption=match.group(1) or os.path.basename(path))
+            displayed_images.add(path)
+        return ''
+
+    # 将报告拆分成段落，只处理段落中实际出现的图片引用
+    for paragraph in report.split('\n\n'):
+        paragraph = MARKDOWN_IMAGE_PATTERN.sub(show_image, paragraph)
         if paragraph.strip():
             st.markdown(paragraph)
-    
-    # 显示报告中未引用的图片
-    for img in unique_images:
-        if img not in displayed_images:
-            st.image(os.path.join(output_dir, img), caption=img)
 
-def run_content(n, cmd_args):
+    # 显示本次运行生成但报告中没有引用的图片
+    for path in sorted(set(images.values()) - displayed_images):
+        st.image(path, caption=os.path.basename(path))
+
+def run_content(n, cmd_args, log):
     with open('./json/agenda.json', 'r', encoding='utf-8') as agenda_file:
         agenda = json.load(agenda_file)
 
@@ -133,28 +227,33 @@ def run_content(n, cmd_args):
         plan_data = json.load(plan_file)
 
     global_vars = load_global_vars()
-    saved_data = {}
+    saved_data = StepDataStore()
     runner = ASTCodeRunner()
     analysis_results = []
 
-    for step in plan_data["steps"]:
-        step_code_path = os.path.join(os.path.dirname(plan_path), f'step_code_{step["step_number"]}.py')
-        step["step_code_path"] = step_code_path
+    # 多个会话同时运行时，步骤通过 code_tools 保存的变量互不影响，运行结束后删除
+    with code_tools.namespace():
+        for step in plan_data["steps"]:
+            step_code_path = os.path.join(os.path.dirname(plan_path), f'step_code_{step["step_number"]}.py')
+            step["step_code_path"] = step_code_path
 
-        if "parameters" in step:
-            for param in step["parameters"]:
-                key = param["key"]
-                default_value = eval(param["value"])
-                value = cmd_args.get(key, default_value)
-                global_vars[key] = value
-                st.write(f"设置参数 {key} = {value}")
+            if "parameters" in step:
+                for param in step["parameters"]:
+                    key = param["key"]
+                    default_value = eval(param["value"])
+                    value = cmd_args.get(key, default_value)
+                    global_vars[key] = value
+                    log.write(f"设置参数 {key} = {value}")
 
-        execute_step(step, global_vars, saved_data, runner, analysis_results)
+            execute_step(step, global_vars, saved_data, runner, analysis_results, log)
 
     llm_client = global_vars['llm_client']
     combined_analysis_results = "\n".join(analysis_results)
     report_message = create_report_prompt(plan_data["query_summary"], combined_analysis_results)
-    final_report = llm_client.text_chat(report_message)
+    # 报告生成过程中逐段显示，生成完后由调用方按图片引用重新排版显示
+    placeholder = st.empty()
+    final_report = placeholder.write_stream(stream_text(llm_client, report_message))
+    placeholder.empty()
 
     # 不再在这里添加图片引用，而是依赖原始报告中的引用
 
@@ -162,6 +261,7 @@ def run_content(n, cmd_args):
 
 def main():
     st.set_page_config(layout="wide")
+    configure_copy_on_write()
     
     tab1, tab2 = st.tabs(["议程", "运行结果"])
     
@@ -199,6 +299,8 @@ def main():
                     value = st.text_input(f"请输入 {param} 的值")
                     st.session_state.param_values[param] = value
             
+            st.session_state.use_cache = st.checkbox("使用最近的运行结果", value=True)
+
             if st.button("确认运行"):
                 st.session_state.confirm_run = True
                 st.rerun()
@@ -210,11 +312,34 @@ def main():
             st.write(f"正在运行任务 {st.session_state.selected_index}")
             
             cmd_args = st.session_state.param_values if 'param_values' in st.session_state else {}
+            cache_key = (st.session_state.selected_index, tuple(sorted(cmd_args.items())))
+            entry = get_cached_result(cache_key) if st.session_state.get("use_cache", True) else None
             
+            cached = True
             try:
-                final_report = run_content(st.session_state.selected_index, cmd_args)
+                if entry:
+                    st.caption(f"使用 {datetime.fromtimestamp(entry['time']).strftime('%H:%M:%S')} 的运行结果 (运行id {entry['run_id']})")
+                    entry["log"].replay()
+                else:
+                    # 步骤的输出在执行过程中逐步显示，同时记录下来用于缓存
+                    # 运行前记录 ./output 中已有的图片，运行中新建或修改的图片复制到这次运行自己的目录
+                    log = RunLog()
+                    images_before = snapshot_images()
+                    final_report = run_content(st.session_state.selected_index, cmd_args, log)
+                    run_id = uuid.uuid4().hex[:8]
+                    entry = {
+                        "time": time.time(),
+                        "run_id": run_id,
+                        "log": log,
+                        "report": final_report,
+                        "images": collect_run_images(images_before, run_id),
+                    }
+                    cached = store_result(cache_key, entry)
                 st.subheader("最终报告")
-                display_report_with_images(final_report, './output')
+                display_report_with_images(entry["report"], entry["images"])
+                # st.image 显示时已经读取了图片，没有缓存的运行不保留复制的图片
+                if not cached:
+                    remove_run_images(entry["run_id"])
             except Exception as e:
                 st.error(f"发生错误: {str(e)}")
             
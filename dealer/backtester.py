@@ -7,16 +7,20 @@ from datetime import datetime, timedelta
 from tqdm import tqdm
 from dealer.futures_provider import MainContractProvider
 from dealer.llm_dealer import LLMDealer
+from dealer.market_data import MarketDataProvider, create_market_data_provider
 
 class Backtester:
-    def __init__(self, symbol: str, start_date: str, end_date: str, llm_client, data_provider: MainContractProvider,
+    def __init__(self, symbol: str, start_date: str, end_date: str, llm_client, data_provider: Union[MarketDataProvider, str, None] = None,
                  compact_mode=False,
                   max_position: int = 5):
+        """
+        :param data_provider: 行情数据源，也可以是 "main"、"file:<目录>"、"synthetic[:<种子>]"，默认为 MainContractProvider
+        """
         self.symbol = symbol
         self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
         self.end_date = datetime.strptime(end_date, '%Y-%m-%d')
         self.llm_client = llm_client
-        self.data_provider = data_provider
+        self.data_provider = create_market_data_provider(data_provider)
         self.max_position = max_position  # 添加 max_position 属性
         self.compact_mode = compact_mode
         
@@ -0,0 +1,112 @@
+"""
+数据源连接的会话管理
+
+导入 dealer 时不再登录任何数据源，第一次调用需要连接的接口时才初始化，之后同一进程中的
+所有 MainContractProvider、LLMDealer、Backtester 共用同一个连接。连接或认证出错时重新连接并重试一次，
+其他错误(合约不存在、参数错误等)直接抛出，不重新登录。
+回测的工作进程各自在第一次调用时建立自己的连接。
+
+    sessions = DataSessions()
+    dates = sessions.call("rqdatac", lambda rq: rq.get_trading_dates(start, end))
+
+新的数据源用 register(name, connect) 注册，connect 返回连接对象(或已经初始化的模块)，
+is_connection_error 判断哪些错误需要重新连接。
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from core.config import get_key
+from core.utils.single_ton import Singleton
+
+
+class DataSourceUnavailable(RuntimeError):
+    """数据源没有配置或者无法连接"""
+
+
+CONNECTION_ERRORS = (ConnectionError, TimeoutError, EOFError)
+# rqdatac 等 SDK 的连接和认证错误没有共同的基类，按类名判断
+CONNECTION_ERROR_NAMES = ("connection", "timeout", "auth", "login", "gateway", "notinit", "expired")
+
+
+def is_connection_error(e: Exception) -> bool:
+    if isinstance(e, CONNECTION_ERRORS):
+        return True
+    name = type(e).__name__.lower()
+    return any(word in name for word in CONNECTION_ERROR_NAMES)
+
+
+def connect_rqdatac():
+    rq_user = get_key('rq_user')
+    rq_pwd = get_key('rq_pwd')
+    if not (rq_user and rq_pwd):
+        raise DataSourceUnavailable("rqdatac 需要在 setting.ini 中配置 rq_user 和 rq_pwd")
+    import rqdatac
+    rqdatac.init(rq_user, rq_pwd)
+    return rqdatac
+
+
+class DataSessions(metaclass=Singleton):
+    def __init__(self):
+        self._connectors: Dict[str, Callable[[], Any]] = {}
+        self._error_checks: Dict[str, Callable[[Exception], bool]] = {}
+        self._sessions: Dict[str, Any] = {}
+        self._connected_at: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.register("rqdatac", connect_rqdatac)
+
+    def register(self, name: str, connect: Callable[[], Any],
+                 connection_error: Callable[[Exception], bool] = is_connection_error):
+        with self._lock:
+            self._connectors[name] = connect
+            self._error_checks[name] = connection_error
+            self._locks.setdefault(name, threading.Lock())
+            self._sessions.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """返回数据源的连接，第一次调用时连接，多个线程同时调用只连接一次"""
+        session = self._sessions.get(name)
+        if session is not None:
+            return session
+        if name not in self._connectors:
+            raise DataSourceUnavailable(f"未注册的数据源: {name}")
+        with self._locks[name]:
+            session = self._sessions.get(name)
+            if session is None:
+                start_time = time.time()
+                session = self._connectors[name]()
+                self._sessions[name] = session
+                self._connected_at[name] = time.time()
+                print(f"数据源 {name} 连接完成，耗时 {time.time() - start_time:.2f} 秒")
+        return session
+
+    def reset(self, name: Optional[str] = None):
+        """断开连接，下次调用时重新连接，name 为 None 时断开所有数据源"""
+        with self._lock:
+            names = [name] if name else list(self._sessions)
+            for key in names:
+                self._sessions.pop(key, None)
+                self._connected_at.pop(key, None)
+
+    def call(self, name: str, func: Callable[[Any], Any], retries: int = 1) -> Any:
+        """
+        用数据源的连接调用 func(session)，连接或认证出错时重新连接后重试 retries 次
+        数据源没有配置时直接抛出 DataSourceUnavailable，查询本身的错误也直接抛出，不重试
+        """
+        for attempt in range(retries + 1):
+            session = self.get(name)
+            try:
+                return func(session)
+            except DataSourceUnavailable:
+                raise
+            except Exception as e:
+                if attempt >= retries or not self._error_checks[name](e):
+                    raise
+                print(f"数据源 {name} 调用失败，重新连接: {type(e).__name__}: {str(e)}")
+                # 其他线程已经重新连接时不再重复断开
+                with self._lock:
+                    if self._sessions.get(name) is session:
+                        self._sessions.pop(name, None)
+
+    def is_connected(self, name: str) -> bool:
+        return name in self._sessions
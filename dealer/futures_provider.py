@@ -5,34 +5,37 @@ import random
 import re
 import time
 from typing import List, Literal, Optional
-import akshare as ak
 import pandas as pd
 import requests
 from core.utils.single_ton import Singleton
 from dealer.lazy import lazy
-rq = None
-from core.config import get_key
-rq_user = get_key('rq_user')
-rq_pwd = get_key('rq_pwd')
-if rq_user and rq_pwd:
-    rq = lazy("rqdatac")
-    rq.init(rq_user,rq_pwd)
+from dealer.data_sessions import DataSessions
+from dealer.market_data import MarketDataProvider
+# akshare 在第一次使用时才真正导入，rqdatac 在第一次调用 rq 接口时才登录
+ak = lazy("akshare")
 
 from core.tushare_doc.ts_code_matcher import StringMatcher
 
 class MainContractGetter(StringMatcher, metaclass=Singleton):
     def __init__(self):
         df_path =  './json/main_contract_cache.pickle'
-        index_cache = './json/main_contract_index_cache.pickle'
+        index_cache = './json/main_contract_index_cache'
         df = pd.read_pickle(df_path)
         super().__init__(df, index_cache=index_cache, index_column='content', result_column='symbol')
     def __getitem__(self, query):
         return self.rapidfuzz_match(query)
 
 
-class MainContractProvider:
+class MainContractProvider(MarketDataProvider):
     def __init__(self) -> None:
-        self.code_getter = MainContractGetter()
+        self._code_getter = None
+
+    @property
+    def code_getter(self) -> MainContractGetter:
+        # 主力合约的缓存和索引在第一次按名称查询合约时才加载
+        if self._code_getter is None:
+            self._code_getter = MainContractGetter()
+        return self._code_getter
     
     def get_bar_data(self, name: str, period: Literal['1', '5', '15', '30', '60', 'D'] = '1', date: Optional[str] = None):
         """
@@ -81,7 +84,7 @@ class MainContractProvider:
         df = self.get_main_contract()
         df.to_pickle('./json/main_contract_cache.pickle')
         from core.tushare_doc.ts_code_matcher import StringMatcher
-        matcher = StringMatcher(df, index_cache='./json/main_contract_index_cache.pickle', index_column='content', result_column='symbol')
+        matcher = StringMatcher(df, index_cache='./json/main_contract_index_cache', index_column='content', result_column='symbol')
     
     def get_shment_news(self, symbol: str = '全部'):
         return ak.futures_news_shmet(symbol=symbol)
@@ -206,14 +209,14 @@ class MainContractProvider:
         if symbol.endswith('0'):
             symbol = symbol[:-1]
         
-        return rq.futures.get_dominant_price(symbol, start_date, end_date, frequency, adjust_type=adjust_type)
+        return DataSessions().call("rqdatac", lambda rq: rq.futures.get_dominant_price(symbol, start_date, end_date, frequency, adjust_type=adjust_type))
     
     def get_trade_calendar(self, start,end) -> List[datetime.date]:
-        return rq.get_trading_dates(start,end)
+        return DataSessions().call("rqdatac", lambda rq: rq.get_trading_dates(start,end))
     
     def get_main_contract(self,code:str)->str:
         code = code[:-1] if code.endswith('0') else code
-        codelist:pd.Series = rq.get_dominant(code)
+        codelist:pd.Series = DataSessions().call("rqdatac", lambda rq: rq.get_dominant(code))
         return codelist.iloc[0]
 
 def curl_to_python_code(curl_command: str) -> str:
@@ -18,6 +18,7 @@ from datetime import datetime, timedelta, time as dt_time
 from dealer.trade_time import get_trading_end_time
 import pytz
 from dealer.futures_provider import MainContractProvider
+from dealer.market_data import MarketDataProvider, create_market_data_provider
 # 设置北京时区
 beijing_tz = pytz.timezone('Asia/Shanghai')
 
@@ -96,7 +97,7 @@ class TradePositionManager:
         return details
 
 class LLMDealer:
-    def __init__(self, llm_client, symbol: str,data_provider: MainContractProvider,trade_rules:str="" ,
+    def __init__(self, llm_client, symbol: str,data_provider: Union[MarketDataProvider, str, None],trade_rules:str="" ,
                  max_daily_bars: int = 60, max_hourly_bars: int = 30, max_minute_bars: int = 240,
                  backtest_date: Optional[str] = None, compact_mode: bool = False,
                  max_position: int = 1):
@@ -105,7 +106,7 @@ class LLMDealer:
         self.symbol = symbol
         self.night_closing_time = self._get_night_closing_time()
         self.backtest_date = backtest_date
-        self.data_provider = data_provider
+        self.data_provider = create_market_data_provider(data_provider)
         self.llm_client = llm_client
         self.last_news_time = None
         self.news_summary = ""
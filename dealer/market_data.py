@@ -0,0 +1,269 @@
+"""
+行情数据源
+
+Backtester 和 LLMDealer 通过 MarketDataProvider 的接口读取行情，可以在创建时选择数据源:
+    MainContractProvider        rqdatac/akshare/新浪的在线数据 (dealer.futures_provider)
+    FileMarketDataProvider      从本地 parquet/csv 分区文件回放，不需要网络
+    SyntheticMarketDataProvider 按随机种子生成确定的行情，用于压力测试和性能分析
+
+    Backtester("SC", "2024-06-03", "2024-06-07", llm_client, "synthetic")
+    Backtester("SC", "2024-06-03", "2024-06-07", llm_client, "file:./data/bars")
+
+get_bar_data 返回的 DataFrame 包含列:
+    datetime, trading_date, open, high, low, close, volume, open_interest (日线另有 date)
+分钟数据返回 date 之前 5 天，日线返回之前 365 天，和 MainContractProvider 一致。
+"""
+import hashlib
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Literal, Optional, Union
+import numpy as np
+import pandas as pd
+
+Period = Literal['1', '5', '15', '30', '60', 'D']
+BAR_COLUMNS = ['datetime', 'trading_date', 'open', 'high', 'low', 'close', 'volume', 'open_interest']
+FREQUENCY_TO_PERIOD = {'1m': '1', '5m': '5', '15m': '15', '30m': '30', '60m': '60', 'D': 'D', '1d': 'D'}
+
+
+class MarketDataProvider(ABC):
+    @abstractmethod
+    def get_bar_data(self, name: str, period: Period = '1', date: Optional[str] = None) -> pd.DataFrame:
+        """返回 date(默认今天) 及之前的 bar 数据"""
+
+    def get_akbar(self, symbol: str, frequency: str = '1m') -> pd.DataFrame:
+        """实盘模式使用的最新行情，以 datetime 为索引"""
+        df = self.get_bar_data(symbol, FREQUENCY_TO_PERIOD.get(frequency, '1'))
+        return df.set_index('datetime')
+
+    def get_futures_news(self, code: str = 'SC0', page_num: int = 0, page_size: int = 20) -> Optional[pd.DataFrame]:
+        # 离线数据源没有新闻
+        return None
+
+    @staticmethod
+    def window(date: Optional[str], period: Period):
+        end_date = datetime.strptime(date, '%Y-%m-%d') if date else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start_date = end_date - timedelta(days=365 if period == 'D' else 5)
+        return start_date, end_date
+
+
+def normalize_bars(df: pd.DataFrame, period: Period) -> pd.DataFrame:
+    """统一列名和类型，缺少 trading_date 时按自然日计算(夜盘算作下一个工作日)"""
+    df = df.rename(columns={'hold': 'open_interest'})
+    if 'datetime' not in df.columns and 'date' in df.columns:
+        df = df.rename(columns={'date': 'datetime'})
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    if 'trading_date' not in df.columns:
+        trading_date = df['datetime'].dt.normalize()
+        night = df['datetime'].dt.hour >= 21
+        trading_date[night] = trading_date[night] + pd.offsets.BDay(1)
+        df['trading_date'] = trading_date
+    df['trading_date'] = pd.to_datetime(df['trading_date'])
+    if 'open_interest' not in df.columns:
+        df['open_interest'] = 0
+    df = df[BAR_COLUMNS].sort_values('datetime', kind='mergesort').reset_index(drop=True)
+    if period == 'D':
+        df['date'] = df['datetime'].dt.normalize()
+    return df
+
+
+def resample_bars(minutes: pd.DataFrame, period: Period) -> pd.DataFrame:
+    """把 1 分钟 bar 合成为 5/15/30/60 分钟或日线"""
+    if period == '1' or minutes.empty:
+        return minutes
+    if period == 'D':
+        groups = minutes.groupby('trading_date', sort=True)
+    else:
+        groups = minutes.groupby(minutes['datetime'].dt.ceil(f'{period}min'), sort=True)
+    bars = groups.agg(open=('open', 'first'), high=('high', 'max'), low=('low', 'min'), close=('close', 'last'),
+                      volume=('volume', 'sum'), open_interest=('open_interest', 'last'), trading_date=('trading_date', 'last'))
+    bars = bars.reset_index(names='datetime')
+    return normalize_bars(bars, period)
+
+
+class FileMarketDataProvider(MarketDataProvider):
+    """
+    从本地文件回放行情，目录结构:
+        root/<合约>/<周期>/<YYYY-MM-DD>.parquet    按交易日分区(也可以是 .csv)
+        root/<合约>/<周期>.parquet                 单个文件
+    周期为 1/5/15/30/60/D，没有某个周期的文件时由 1 分钟数据合成。
+    合约名称按原样、大写、去掉末尾的 0 依次查找，SC0 和 SC 使用同一个目录。
+    读取过的文件缓存在内存中(最多 max_cached_files 个)。
+    """
+
+    def __init__(self, root: str, max_cached_files: int = 256):
+        self.root = root
+        self.max_cached_files = max_cached_files
+        self._cache: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _symbol_dir(self, name: str) -> Optional[str]:
+        for candidate in (name, name.upper(), name[:-1] if name.endswith('0') else None, name.upper().rstrip('0')):
+            if candidate and os.path.isdir(os.path.join(self.root, candidate)):
+                return os.path.join(self.root, candidate)
+        return None
+
+    def _read(self, path: str) -> pd.DataFrame:
+        with self._lock:
+            if path in self._cache:
+                self._cache.move_to_end(path)
+                return self._cache[path]
+        df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+        with self._lock:
+            self._cache[path] = df
+            while len(self._cache) > self.max_cached_files:
+                self._cache.popitem(last=False)
+        return df
+
+    def _load(self, symbol_dir: str, period: Period, start_date: datetime, end_date: datetime) -> Optional[pd.DataFrame]:
+        for ext in ('.parquet', '.csv'):
+            path = os.path.join(symbol_dir, f"{period}{ext}")
+            if os.path.isfile(path):
+                return normalize_bars(self._read(path).copy(), period)
+        partition_dir = os.path.join(symbol_dir, period)
+        if not os.path.isdir(partition_dir):
+            return None
+        frames = []
+        for file_name in sorted(os.listdir(partition_dir)):
+            stem, ext = os.path.splitext(file_name)
+            if ext not in ('.parquet', '.csv'):
+                continue
+            try:
+                day = datetime.strptime(stem, '%Y-%m-%d')
+            except ValueError:
+                continue
+            if start_date <= day <= end_date:
+                frames.append(self._read(os.path.join(partition_dir, file_name)))
+        if not frames:
+            return normalize_bars(pd.DataFrame(columns=BAR_COLUMNS), period)
+        return normalize_bars(pd.concat(frames, ignore_index=True), period)
+
+    def get_bar_data(self, name: str, period: Period = '1', date: Optional[str] = None) -> pd.DataFrame:
+        start_date, end_date = self.window(date, period)
+        symbol_dir = self._symbol_dir(name)
+        if symbol_dir is None:
+            raise FileNotFoundError(f"No market data for {name} under {self.root}")
+        df = self._load(symbol_dir, period, start_date, end_date)
+        if df is None:
+            minutes = self._load(symbol_dir, '1', start_date, end_date)
+            if minutes is None:
+                raise FileNotFoundError(f"No {period} or 1 minute bars for {name} under {symbol_dir}")
+            df = resample_bars(minutes, period)
+        mask = (df['trading_date'] >= start_date) & (df['trading_date'] <= end_date)
+        return df[mask].reset_index(drop=True)
+
+    def save_bars(self, name: str, period: Period, df: pd.DataFrame, file_format: str = 'parquet'):
+        """按交易日分区保存 bar 数据，可以把在线数据源的数据保存下来离线回放"""
+        df = normalize_bars(df.copy(), period)
+        partition_dir = os.path.join(self.root, name, period)
+        os.makedirs(partition_dir, exist_ok=True)
+        for trading_date, bars in df.groupby('trading_date'):
+            path = os.path.join(partition_dir, f"{trading_date.strftime('%Y-%m-%d')}.{file_format}")
+            if file_format == 'parquet':
+                bars.to_parquet(path, index=False)
+            else:
+                bars.to_csv(path, index=False)
+            with self._lock:
+                self._cache.pop(path, None)
+
+
+class SyntheticMarketDataProvider(MarketDataProvider):
+    """
+    生成确定的模拟行情，同一个 (seed, 合约, 日期) 每次生成的数据相同
+    每个工作日的收盘价是一条随机游走，日内 1 分钟 bar 是从开盘价到收盘价的布朗桥，
+    交易时间为 09:01-11:30 和 13:01-15:00 (没有夜盘)，其他周期由 1 分钟 bar 合成
+    """
+    SESSIONS = [("09:00", 150), ("13:00", 120)]
+
+    def __init__(self, seed: int = 0, start_price: float = 500.0, daily_volatility: float = 0.015,
+                 base_volume: int = 200, max_cached_days: int = 2048):
+        self.seed = seed
+        self.start_price = start_price
+        self.daily_volatility = daily_volatility
+        self.base_volume = base_volume
+        self.max_cached_days = max_cached_days
+        self._days: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+        self._closes = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, *keys) -> np.random.Generator:
+        digest = hashlib.sha256(repr((self.seed,) + keys).encode('utf-8')).digest()
+        return np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+
+    def _close_path(self, symbol: str) -> pd.Series:
+        """从 2000-01-03 开始每个工作日的收盘价，只生成一次"""
+        path = self._closes.get(symbol)
+        if path is None:
+            days = pd.bdate_range('2000-01-03', '2040-12-31')
+            returns = self._rng(symbol, 'D').normal(0, self.daily_volatility, len(days))
+            path = pd.Series(self.start_price * np.exp(np.cumsum(returns)), index=days)
+            self._closes[symbol] = path
+        return path
+
+    def _day_bars(self, symbol: str, day: pd.Timestamp) -> pd.DataFrame:
+        key = (symbol, day)
+        with self._lock:
+            if key in self._days:
+                self._days.move_to_end(key)
+                return self._days[key]
+        closes = self._close_path(symbol)
+        position = closes.index.get_loc(day)
+        close = closes.iloc[position]
+        open_price = closes.iloc[position - 1] if position else self.start_price
+        times = np.concatenate([pd.date_range(day + pd.Timedelta(f"{start}:00") + pd.Timedelta(minutes=1), periods=count, freq='min').values
+                                for start, count in self.SESSIONS])
+        n = len(times)
+        rng = self._rng(symbol, day.strftime('%Y-%m-%d'))
+        # 布朗桥: 从 log(开盘价) 出发，结束在 log(收盘价)
+        steps = rng.normal(0, self.daily_volatility / np.sqrt(n), n)
+        walk = np.cumsum(steps)
+        walk -= np.arange(1, n + 1) / n * walk[-1]
+        log_close = np.log(open_price) + np.arange(1, n + 1) / n * (np.log(close) - np.log(open_price)) + walk
+        bar_close = np.exp(log_close)
+        bar_open = np.concatenate([[open_price], bar_close[:-1]])
+        spread = np.abs(rng.normal(0, self.daily_volatility / np.sqrt(n), n)) * bar_close
+        bars = pd.DataFrame({
+            'datetime': times,
+            'trading_date': day,
+            'open': bar_open,
+            'high': np.maximum(bar_open, bar_close) + spread,
+            'low': np.minimum(bar_open, bar_close) - spread,
+            'close': bar_close,
+            'volume': rng.poisson(self.base_volume, n),
+            'open_interest': 10000 + np.cumsum(rng.integers(-5, 6, n)),
+        })
+        with self._lock:
+            self._days[key] = bars
+            while len(self._days) > self.max_cached_days:
+                self._days.popitem(last=False)
+        return bars
+
+    def get_bar_data(self, name: str, period: Period = '1', date: Optional[str] = None) -> pd.DataFrame:
+        start_date, end_date = self.window(date, period)
+        symbol = name.upper().rstrip('0') or name
+        days = pd.bdate_range(start_date, end_date)
+        minutes = pd.concat([self._day_bars(symbol, day) for day in days], ignore_index=True) if len(days) \
+            else pd.DataFrame(columns=BAR_COLUMNS)
+        return resample_bars(minutes, period) if period != '1' else normalize_bars(minutes, period)
+
+
+def create_market_data_provider(spec: Union[str, MarketDataProvider, None] = None) -> MarketDataProvider:
+    """
+    按名称创建数据源，已经是数据源对象时直接返回
+        None / "main"         MainContractProvider
+        "file:<目录>"         FileMarketDataProvider
+        "synthetic[:<种子>]"  SyntheticMarketDataProvider
+    """
+    if spec is None or spec == "main":
+        from dealer.futures_provider import MainContractProvider
+        return MainContractProvider()
+    if not isinstance(spec, str):
+        return spec
+    kind, _, argument = spec.partition(":")
+    if kind == "file":
+        return FileMarketDataProvider(argument or "./data/bars")
+    if kind == "synthetic":
+        return SyntheticMarketDataProvider(seed=int(argument or 0))
+    raise ValueError(f"Unknown market data provider: {spec}")
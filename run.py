@@ -1,5 +1,6 @@
 import sys
 from core.run_content import run_content
+from core.interpreter.step_data_store import configure_copy_on_write
 
 if __name__ =="__main__":
     if len(sys.argv) < 2:
@@ -14,4 +15,5 @@ if __name__ =="__main__":
         key, value = arg.split('=')
         cmd_args[key] = value
     
+    configure_copy_on_write()
     run_content(n, cmd_args)
\ No newline at end of file